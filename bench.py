@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Headless benchmark of generate.py and export.py under CPython.
+
+Every shape in generate.py's index is built at its defaults and at a sweep of
+parameter values, and exported to every format. Each case records the
+BuildPart time, the tessellation time, the export time for each format and the
+output sizes. The timings come from the same phase timers the browser reports
+in window.perfData.
+
+    python bench.py                                     # run, write bench_results.json
+    python bench.py --baseline bench_baseline.json      # ... and compare, exit 1 on regressions
+    python bench.py --shapes box torus --sweep radius=10,50 --repeat 9
+
+Save a run as the baseline by copying its results file.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import native
+
+# Default sweep: every positive size-like parameter scaled by these factors (angles are left alone)
+SCALES = (0.5, 2.0)
+
+QUALITIES = ('coarse', 'fine')
+
+
+def sweep_cases(shape, definition, sweeps):
+    """(case name, {parameter: value}) for the defaults and each swept value."""
+    cases = [(f'{shape}/default', {})]
+    for param in definition['children']:
+        if param['type'] != 'num':
+            continue
+
+        name = param['name']
+        if name in sweeps:
+            values = sweeps[name]
+        elif not sweeps and param['value'] > 0 and 'arc' not in name:
+            values = [param['value'] * scale for scale in SCALES]
+        else:
+            continue
+
+        cases += [(f'{shape}/{name}={value:g}', {name: value}) for value in values]
+    return cases
+
+
+def custom_data(definition, changes):
+    data = json.loads(json.dumps(definition))
+    for param in data['children']:
+        if param['name'] in changes:
+            param['value'] = changes[param['name']]
+    return json.dumps(data)
+
+
+def measure(data, quality, formats):
+    """One build: phase timings (ms) and output sizes from the perf report."""
+    # every run starts cold: no kept builds, stage outputs or cached exports
+    native.model_session().release()
+
+    header = native.read_header(native.build({
+        'customData': data,
+        'quality': quality,
+        'format': 'mesh',
+        'formats': formats,
+    }))
+    report = header['perf']
+
+    def total(predicate):
+        return sum(p['ms'] for p in report['phases'] if predicate(p['phase']))
+
+    metrics = {
+        'build_ms': total(lambda name: name == 'build'),
+        'tessellate_ms': total(lambda name: name.startswith('tessellate')),
+        'generate_ms': total(lambda name: name == 'generate.py'),
+        'export_total_ms': total(lambda name: name == 'export.py'),
+    }
+    for fmt in formats:
+        metrics[f'export_{fmt}_ms'] = total(lambda name: name == f'export {fmt}')
+
+    sizes = {}
+    for part in report['parts']:
+        for key, value in part.items():
+            if key != 'name':
+                sizes[key] = sizes.get(key, 0) + value
+    return metrics, sizes
+
+
+def cases(index, ParameterGroup, shapes, sweeps):
+    """{case name: parameter JSON} for every shape."""
+    data = {}
+    for shape in shapes:
+        if shape not in index:
+            raise SystemExit(f"❌ Unknown shape '{shape}'. Expected one of: {list(index)}")
+
+        definition = json.loads(ParameterGroup(list(index[shape])).dumps())
+        for case, changes in sweep_cases(shape, definition, sweeps):
+            data[case] = custom_data(definition, changes)
+    return data
+
+
+def run(cases, quality, formats, repeat):
+    results = {}
+
+    for case, data in cases.items():
+        try:
+            # untimed warm-up: compiling generate.py and first-call imports are not part of the case
+            measure(data, quality, formats)
+            runs = [measure(data, quality, formats) for _ in range(repeat)]
+        except native.NativeBuildError as e:
+            # e.g. a swept value the shape does not accept; recorded, not compared
+            results[case] = {'error': str(e)}
+            print(f"  {case:<32} ❌ {e}")
+            continue
+
+        # median of each timing, and how far the runs spread around it; sizes are deterministic
+        timings = {key: round(statistics.median(r[0][key] for r in runs), 2) for key in runs[0][0]}
+        noise = {key: round(max(r[0][key] for r in runs) - min(r[0][key] for r in runs), 2) for key in runs[0][0]}
+        results[case] = {**timings, **runs[0][1], 'noise': noise}
+        print(f"  {case:<32} build {timings['build_ms']:>8.1f} ms  tessellate {timings['tessellate_ms']:>8.1f} ms  "
+              f"triangles {results[case].get('triangles', 0):>7}")
+
+    return results
+
+
+def faster(result, again):
+    """result with each timing replaced by a faster re-measurement of the same case."""
+    merged = dict(result)
+    for key, value in again.items():
+        if key.endswith('_ms') and value < merged[key]:
+            merged[key] = value
+            merged['noise'] = {**merged['noise'], key: again['noise'][key]}
+    return merged
+
+
+def compare(results, baseline, threshold, min_ms, size_threshold):
+    """Regressions against the baseline: timings slower by more than threshold, min_ms and the
+    spread of both runs' repeats; sizes larger by size_threshold."""
+    regressions = []
+    for case, metrics in results.items():
+        previous = baseline.get('results', {}).get(case)
+        if previous is None:
+            continue
+
+        for key, value in metrics.items():
+            old = previous.get(key)
+            if key == 'noise' or not isinstance(old, (int, float)) or not old:
+                continue
+            if key.endswith('_ms'):
+                # a slowdown within what repeated runs already vary by is noise
+                noise = metrics['noise'].get(key, 0) + previous.get('noise', {}).get(key, 0)
+                if value - old > max(old * threshold, min_ms, noise):
+                    regressions.append((case, key, old, value))
+            elif value > old * (1 + size_threshold):
+                regressions.append((case, key, old, value))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shapes', nargs='+', help='shapes to run (default: every entry of the index)')
+    parser.add_argument('--sweep', action='append', default=[], metavar='NAME=V1,V2,...',
+                        help=f'values for a parameter, replacing the default sweep (sizes x {SCALES})')
+    parser.add_argument('--quality', choices=QUALITIES, default='fine', help='preview tessellation (default: fine)')
+    parser.add_argument('--formats', nargs='*', default=['stl', 'step', 'brep'], help='export formats to time')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timed builds per case, after an untimed warm-up; the median is kept (default: 5)')
+    parser.add_argument('--output', default='bench_results.json', help='results file (default: bench_results.json)')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown as a fraction (default: 0.25)')
+    parser.add_argument('--min-ms', type=float, default=5.0, help='ignore slowdowns smaller than this (default: 5 ms)')
+    parser.add_argument('--size-threshold', type=float, default=0.0, help='allowed growth of output sizes (default: 0)')
+    args = parser.parse_args()
+
+    sweeps = {}
+    for item in args.sweep:
+        name, _, values = item.partition('=')
+        sweeps[name] = [float(v) for v in values.split(',') if v]
+
+    index, ParameterGroup = native.load_index()
+    shapes = args.shapes or list(index)
+    data = cases(index, ParameterGroup, shapes, sweeps)
+
+    print(f"⏱️  Benchmarking {len(shapes)} shape(s), {args.repeat} run(s) per case...")
+    start = time.perf_counter()
+    results = run(data, args.quality, args.formats, args.repeat)
+
+    baseline = regressions = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_ms, args.size_threshold)
+        # the machine slows down for seconds at a time: a slowdown that is gone when the case
+        # is measured again was not the code
+        again = sorted({case for case, key, old, new in regressions if key.endswith('_ms')})
+        if again:
+            print(f"🔁 Re-measuring {len(again)} case(s) slower than the baseline...")
+            remeasured = run({case: data[case] for case in again}, args.quality, args.formats, args.repeat)
+            for case in again:
+                results[case] = faster(results[case], remeasured[case])
+            regressions = compare(results, baseline, args.threshold, args.min_ms, args.size_threshold)
+
+    import build123d
+    document = {
+        'meta': {
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'build123d': getattr(build123d, '__version__', 'unknown'),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'quality': args.quality,
+            'formats': args.formats,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+    print(f"📄 {len(results)} case(s) in {time.perf_counter() - start:.1f} s, written to {args.output}")
+
+    if baseline is not None:
+        for case, key, old, new in regressions:
+            print(f"❌ {case} {key}: {old:g} -> {new:g} ({(new / old - 1) * 100:+.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,68 +1,455 @@
-# Export script - handles STL generation and data preparation for 3D viewer
+# Export script - handles mesh generation and data preparation for 3D viewer
 # This script expects an 'output' variable to be defined with the following structure:
 # output = [
 #     {"name": "part_name", "part": part_geometry, "color": "#hex_color", "opacity": 0.8},  # opacity is optional
 #     ...
 # ]
+#
+# Only the preview stage runs on every build: it tessellates each part once into
+# indexed typed arrays (positions, normals, index and edge segments) that the viewer
+# wraps directly as BufferGeometry, or (export_options = {'format': 'glb'}) into one
+# binary glTF with quantized, instanced meshes. STL, STEP and BREP are exported on
+# demand by export_format() (called when a download button is clicked) from the parts
+# of the last build. Exports are cached on the part dictionaries, so a build served
+# from build_cache reuses them too.
+#
+# All exports are written into in-memory buffers; nothing is left behind in the
+# Emscripten filesystem. Outside the browser the module can be imported for its
+# functions (see native.py); the script part only runs under Pyodide.
 
-print("Starting export process...")
-
-# Validate output variable exists
-if 'output' not in globals():
-    raise ValueError("No 'output' variable found. Please define output as a list of parts with name, part, and color.")
-
-if not isinstance(output, list):
-    raise ValueError("Output must be a list of part dictionaries.")
-
-if len(output) == 0:
-    raise ValueError("Output list is empty. Please add at least one part.")
-
-# Export each part individually and collect STL, STEP, and BREP data
-parts_data = []
-for i, part_info in enumerate(output):
-    # Validate part structure
-    if not isinstance(part_info, dict):
-        raise ValueError(f"Part {i} must be a dictionary with 'name', 'part', and 'color' keys.")
-    
-    required_keys = ['name', 'part', 'color']
-    missing_keys = [key for key in required_keys if key not in part_info]
-    if missing_keys:
-        raise ValueError(f"Part {i} is missing required keys: {missing_keys}")
-    
-    # Generate filenames and export STL, STEP, and BREP
-    stl_filename = f"output_part_{i}_{part_info['name']}.stl"
-    step_filename = f"output_part_{i}_{part_info['name']}.step"
-    brep_filename = f"output_part_{i}_{part_info['name']}.brep"
-    
-    export_stl(part_info['part'], stl_filename)
-    export_step(part_info['part'], step_filename)
-    export_brep(part_info['part'], brep_filename)
-    
-    # Read STL data
-    with open(stl_filename, 'rb') as fh:
-        stl_data = fh.read()
-    
-    # Read STEP data
-    with open(step_filename, 'rb') as fh:
-        step_data = fh.read()
-    
-    # Read BREP data
-    with open(brep_filename, 'rb') as fh:
-        brep_data = fh.read()
-    
-    # Prepare part data for JavaScript (include opacity if specified)
-    part_data = {
-        'name': part_info['name'],
-        'color': part_info['color'],
-        'stl': to_js(stl_data, create_pyproxies=False),
-        'step': to_js(step_data, create_pyproxies=False),
-        'brep': to_js(brep_data, create_pyproxies=False),
+import json
+import math
+import os
+import struct
+from io import BytesIO
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from build123d.topology import Shape
+from OCP.TopLoc import TopLoc_Location
+
+try:
+    from js import Object
+    from pyodide.ffi import create_proxy
+    WEBPY = True
+except ImportError:
+    WEBPY = False
+
+if not WEBPY:
+    from build123d import *
+    from utils import perf
+
+
+# Tessellation profiles, (linear, angular) deflection. 'coarse' is used while parameters
+# are changing, 'fine' (the build123d export defaults) once input settles and for downloads.
+DEFLECTION = {
+    'coarse': (0.1, 0.5),
+    'fine': (1e-3, 0.1),
+}
+
+# Binary STL record: normal, three vertices, attribute byte count
+STL_RECORD = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attr', '<u2')])
+
+
+def normalize(vectors):
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, lengths, out=np.zeros_like(vectors), where=lengths > 0)
+
+
+def edge_segments(edge, angular_tolerance):
+    """Line segment pairs approximating an edge, for outline rendering."""
+    if edge.geom_type == GeomType.LINE:
+        count = 1
+    else:
+        count = max(8, min(256, math.ceil(2 * math.pi / angular_tolerance)))
+
+    points = [edge.position_at(i / count) for i in range(count + 1)]
+    points = np.array([(v.X, v.Y, v.Z) for v in points], dtype=np.float32)
+    return np.stack([points[:-1], points[1:]], axis=1).reshape(-1, 3)
+
+
+def mesh_data(part, tolerance=1e-3, angular_tolerance=0.1):
+    """Indexed mesh (positions, normals, index) and edge segments from a single tessellation."""
+    vertices, triangles = part.tessellate(tolerance, angular_tolerance)
+    positions = np.array([(v.X, v.Y, v.Z) for v in vertices], dtype=np.float32).reshape(-1, 3)
+    index = np.array(triangles, dtype=np.uint32).reshape(-1, 3)
+
+    # Area weighted vertex normals. tessellate() does not share vertices between
+    # faces, so the normals stay smooth across a face and sharp across its edges.
+    corners = positions[index]
+    face_normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    normals = np.zeros_like(positions)
+    for k in range(3):
+        np.add.at(normals, index[:, k], face_normals)
+
+    segments = [edge_segments(edge, angular_tolerance) for edge in part.edges()]
+    edges = np.concatenate(segments) if segments else np.zeros((0, 3), dtype=np.float32)
+
+    return {
+        'positions': positions.ravel(),
+        'normals': normalize(normals).ravel(),
+        'index': index.ravel(),
+        'edges': edges.ravel(),
     }
-    # Add opacity if specified
-    if 'opacity' in part_info:
-        part_data['opacity'] = part_info['opacity']
-    
-    parts_data.append(part_data)
-    
-# Store parts data for 3D viewer (list of parts with names, colors, and STL data)
-window.partsData = to_js(parts_data, create_pyproxies=False)
\ No newline at end of file
+
+
+def cached_mesh(part_info, kind, shape, quality):
+    """Tessellate shape() once per quality and cache it on the part.
+
+    A coarse request is served by the fine mesh when one exists, and computing
+    the fine mesh drops the coarse one.
+    """
+    exports = part_info.setdefault('_exports', {})
+    key = f'{kind}_{quality}'
+    if quality == 'coarse' and f'{kind}_fine' in exports:
+        key = f'{kind}_fine'
+
+    if key not in exports:
+        with perf.phase(f'tessellate {quality}', part=part_info['name']):
+            exports[key] = mesh_data(shape(), *DEFLECTION[quality])
+        if quality == 'fine':
+            exports.pop(f'{kind}_coarse', None)
+
+    mesh = exports[key]
+    perf.part(part_info['name'], triangles=len(mesh['index']) // 3, mesh_bytes=sum(a.nbytes for a in mesh.values()))
+    return mesh
+
+
+def part_mesh(part_info, quality='fine'):
+    """The display mesh of a part."""
+    return cached_mesh(part_info, 'mesh', lambda: part_info['part'], quality)
+
+
+def stl_bytes(part_info):
+    """Binary STL written from the cached display mesh straight into memory."""
+    mesh = part_mesh(part_info, 'fine')
+    corners = mesh['positions'].reshape(-1, 3)[mesh['index'].reshape(-1, 3)]
+
+    records = np.zeros(len(corners), dtype=STL_RECORD)
+    records['normal'] = normalize(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]))
+    records['vertices'] = corners
+
+    buffer = BytesIO()
+    buffer.write(b'build123d'.ljust(80, b'\0'))
+    buffer.write(np.uint32(len(records)).tobytes())
+    buffer.write(records.tobytes())
+    return buffer.getbuffer()
+
+
+def brep_bytes(part_info):
+    buffer = BytesIO()
+    export_brep(part_info['part'], buffer)
+    return buffer.getbuffer()
+
+
+def step_bytes(part_info):
+    # export_step only writes to a path, so use a scratch directory that is always removed
+    with TemporaryDirectory() as scratch:
+        filename = os.path.join(scratch, 'part.step')
+        export_step(part_info['part'], filename)
+        with open(filename, 'rb') as fh:
+            return memoryview(fh.read())
+
+
+# glTF component types
+GL_BYTE = 5120
+GL_UNSIGNED_SHORT = 5123
+GL_UNSIGNED_INT = 5125
+
+
+def srgb_to_linear(value):
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def base_color(color, opacity, shade=1.0):
+    """glTF baseColorFactor (linear RGBA) from a "#rrggbb" colour and an opacity."""
+    color = color.lstrip('#')
+    rgb = [srgb_to_linear(shade * int(color[i:i + 2], 16) / 255.0) for i in (0, 2, 4)]
+    return rgb + [float(opacity)]
+
+
+def location_matrix(location):
+    """4x4 matrix of a build123d Location."""
+    trsf = location.wrapped.Transformation()
+    matrix = np.eye(4)
+    for row in range(3):
+        for col in range(4):
+            matrix[row, col] = trsf.Value(row + 1, col + 1)
+    return matrix
+
+
+def instance_groups(parts):
+    """Group parts that share a shape (same TShape, any Location) and the same look."""
+    groups = []
+    for part_info in parts:
+        look = (part_info['color'], part_info.get('opacity', 1.0))
+        for group in groups:
+            first = group[0]
+            if (first['color'], first.get('opacity', 1.0)) == look and first['part'].wrapped.IsPartner(part_info['part'].wrapped):
+                group.append(part_info)
+                break
+        else:
+            groups.append([part_info])
+    return groups
+
+
+def local_mesh(part_info, quality='fine'):
+    """Display mesh of a part with its Location removed."""
+    return cached_mesh(part_info, 'local_mesh', lambda: Shape.cast(part_info['part'].wrapped.Located(TopLoc_Location())), quality)
+
+
+class GlbWriter:
+    """Minimal glTF 2.0 binary writer for quantized, instanced meshes."""
+
+    def __init__(self):
+        self.gltf = {
+            'asset': {'version': '2.0', 'generator': 'build123d export.py'},
+            'extensionsUsed': ['KHR_mesh_quantization'],
+            'extensionsRequired': ['KHR_mesh_quantization'],
+            'scene': 0,
+            'scenes': [{'nodes': []}],
+            'nodes': [],
+            'meshes': [],
+            'materials': [],
+            'accessors': [],
+            'bufferViews': [],
+        }
+        self.body = BytesIO()
+
+    def add_view(self, array, target=None, stride=None):
+        data = array.tobytes()
+        view = {'buffer': 0, 'byteOffset': self.body.tell(), 'byteLength': len(data)}
+        if target is not None:
+            view['target'] = target
+        if stride is not None:
+            view['byteStride'] = stride
+        self.body.write(data)
+        self.body.write(b'\0' * (-len(data) % 4))
+        self.gltf['bufferViews'].append(view)
+        return len(self.gltf['bufferViews']) - 1
+
+    def add_accessor(self, view, component_type, count, kind, normalized=False, bounds=None):
+        accessor = {'bufferView': view, 'componentType': component_type, 'count': int(count), 'type': kind}
+        if normalized:
+            accessor['normalized'] = True
+        if bounds is not None:
+            accessor['min'], accessor['max'] = bounds
+        self.gltf['accessors'].append(accessor)
+        return len(self.gltf['accessors']) - 1
+
+    def add_positions(self, points, origin, scale):
+        # unsigned short normalized, padded to 4 components for 4-byte alignment
+        quantized = np.zeros((len(points), 4), dtype=np.uint16)
+        quantized[:, :3] = np.round((points - origin) / scale * 65535)
+        bounds = (quantized[:, :3].min(axis=0).tolist(), quantized[:, :3].max(axis=0).tolist())
+        view = self.add_view(quantized, target=34962, stride=8)
+        return self.add_accessor(view, GL_UNSIGNED_SHORT, len(points), 'VEC3', normalized=True, bounds=bounds)
+
+    def add_normals(self, normals):
+        quantized = np.zeros((len(normals), 4), dtype=np.int8)
+        quantized[:, :3] = np.round(normals * 127)
+        view = self.add_view(quantized, target=34962, stride=4)
+        return self.add_accessor(view, GL_BYTE, len(normals), 'VEC3', normalized=True)
+
+    def add_material(self, name, rgba):
+        material = {
+            'name': name,
+            'pbrMetallicRoughness': {'baseColorFactor': rgba, 'metallicFactor': 0.0, 'roughnessFactor': 0.5},
+        }
+        if rgba[3] < 1.0:
+            material['alphaMode'] = 'BLEND'
+        self.gltf['materials'].append(material)
+        return len(self.gltf['materials']) - 1
+
+    def add_mesh(self, mesh, color, opacity, name):
+        """Add a quantized mesh, returning its index and the matrix that dequantizes it."""
+        positions = mesh['positions'].reshape(-1, 3)
+        edges = mesh['edges'].reshape(-1, 3)
+        points = np.concatenate([positions, edges])
+        origin = points.min(axis=0)
+        scale = float((points.max(axis=0) - origin).max()) or 1.0
+
+        index = mesh['index']
+        index_type = GL_UNSIGNED_SHORT if len(positions) < 65536 else GL_UNSIGNED_INT
+        index = index.astype(np.uint16 if index_type == GL_UNSIGNED_SHORT else np.uint32)
+
+        primitives = [{
+            'attributes': {
+                'POSITION': self.add_positions(positions, origin, scale),
+                'NORMAL': self.add_normals(mesh['normals'].reshape(-1, 3)),
+            },
+            'indices': self.add_accessor(self.add_view(index, target=34963), index_type, len(index), 'SCALAR'),
+            'material': self.add_material(name, base_color(color, opacity)),
+        }]
+        if len(edges):
+            primitives.append({
+                'attributes': {'POSITION': self.add_positions(edges, origin, scale)},
+                'mode': 1,  # LINES
+                'material': self.add_material(f'{name}_edges', base_color(color, 1.0, shade=0.5)),
+            })
+
+        self.gltf['meshes'].append({'name': name, 'primitives': primitives})
+
+        # uniform scale, so the normals need no correction
+        dequantize = np.diag([scale, scale, scale, 1.0])
+        dequantize[:3, 3] = origin
+        return len(self.gltf['meshes']) - 1, dequantize
+
+    def add_node(self, name, mesh, matrix):
+        self.gltf['nodes'].append({'name': name, 'mesh': mesh, 'matrix': matrix.T.ravel().tolist()})
+        self.gltf['scenes'][0]['nodes'].append(len(self.gltf['nodes']) - 1)
+
+    def tobytes(self):
+        body = self.body.getvalue()
+        self.gltf['buffers'] = [{'byteLength': len(body)}]
+        header = json.dumps(self.gltf, separators=(',', ':')).encode()
+        header += b' ' * (-len(header) % 4)
+
+        glb = BytesIO()
+        glb.write(struct.pack('<4sII', b'glTF', 2, 12 + 8 + len(header) + 8 + len(body)))
+        glb.write(struct.pack('<I4s', len(header), b'JSON'))
+        glb.write(header)
+        glb.write(struct.pack('<I4s', len(body), b'BIN\0'))
+        glb.write(body)
+        return glb.getbuffer()
+
+
+def glb_bytes(parts, quality='fine'):
+    """Binary glTF of all parts; parts sharing a shape are tessellated once and instanced."""
+    writer = GlbWriter()
+    for group in instance_groups(parts):
+        first = group[0]
+        mesh, dequantize = writer.add_mesh(local_mesh(first, quality), first['color'], first.get('opacity', 1.0), first['name'])
+        for part_info in group:
+            writer.add_node(part_info['name'], mesh, location_matrix(part_info['part'].location) @ dequantize)
+
+    return writer.tobytes()
+
+
+# In-memory exporters for every downloadable format
+EXPORTERS = {
+    'stl': stl_bytes,
+    'step': step_bytes,
+    'brep': brep_bytes,
+}
+
+
+def export_part(part_info, fmt):
+    """Export a single part to fmt, reusing the buffer cached on the part if already exported."""
+    exports = part_info.setdefault('_exports', {})
+    if fmt not in exports:
+        with perf.phase(f'export {fmt}', part=part_info['name']):
+            exports[fmt] = EXPORTERS[fmt](part_info)
+
+    perf.part(part_info['name'], **{f'{fmt}_bytes': len(exports[fmt])})
+    return exports[fmt]
+
+
+def export_format(fmt):
+    """Deferred export of every part of the last build (used by FileDownloads).
+
+    Each buffer is handed to JavaScript as a proxy so it can be read in place
+    with getBuffer() instead of being copied by to_js.
+    """
+    if fmt not in EXPORTERS:
+        raise ValueError(f"Unknown export format '{fmt}'. Expected one of: {list(EXPORTERS)}")
+
+    print(f"Exporting {fmt.upper()} for {len(_last_output)} part(s)...")
+    parts = []
+    for part_info in _last_output:
+        parts.append({
+            'name': part_info['name'],
+            'data': create_proxy(export_part(part_info, fmt)),
+        })
+
+    return to_js(parts, create_pyproxies=False, dict_converter=Object.fromEntries)
+
+
+def validate_output(output):
+    """Check the structure of the 'output' list produced by a model script."""
+    if output is None:
+        raise ValueError("No 'output' variable found. Please define output as a list of parts with name, part, and color.")
+
+    if not isinstance(output, list):
+        raise ValueError("Output must be a list of part dictionaries.")
+
+    if len(output) == 0:
+        raise ValueError("Output list is empty. Please add at least one part.")
+
+    for i, part_info in enumerate(output):
+        # Validate part structure
+        if not isinstance(part_info, dict):
+            raise ValueError(f"Part {i} must be a dictionary with 'name', 'part', and 'color' keys.")
+
+        required_keys = ['name', 'part', 'color']
+        missing_keys = [key for key in required_keys if key not in part_info]
+        if missing_keys:
+            raise ValueError(f"Part {i} is missing required keys: {missing_keys}")
+
+    return output
+
+
+def preview(output, options):
+    """Preview stage: export only what the 3D viewer displays, at the requested quality.
+
+    Returns the per-part data (mesh arrays in 'mesh' format) and the GLB bytes
+    (in 'glb' format, otherwise None).
+    """
+    # Viewer payload: 'mesh' sends typed arrays per part, 'glb' sends one instanced binary glTF
+    preview_format = options.get('format', 'mesh')
+    if preview_format not in ('mesh', 'glb'):
+        raise ValueError(f"Unknown preview format '{preview_format}'. Expected 'mesh' or 'glb'.")
+
+    preview_quality = options.get('quality', 'fine')
+    if preview_quality not in DEFLECTION:
+        raise ValueError(f"Unknown preview quality '{preview_quality}'. Expected one of: {list(DEFLECTION)}")
+
+    parts_data = []
+    for part_info in output:
+        # Prepare part data for JavaScript (include opacity if specified)
+        part_data = {
+            'name': part_info['name'],
+            'color': part_info['color'],
+        }
+        if preview_format == 'mesh':
+            part_data['mesh'] = part_mesh(part_info, preview_quality)
+
+        # Add opacity if specified
+        if 'opacity' in part_info:
+            part_data['opacity'] = part_info['opacity']
+
+        parts_data.append(part_data)
+
+    scene_glb = None
+    if preview_format == 'glb':
+        with perf.phase('glb'):
+            scene_glb = glb_bytes(output, preview_quality)
+        print(f"GLB: {len(output)} part(s), {len(scene_glb)} bytes")
+
+    return parts_data, scene_glb
+
+
+if WEBPY:
+    print("Starting export process...")
+
+    # Keep a handle to the parts of this build for deferred exports
+    _last_output = validate_output(globals().get('output'))
+
+    parts_data, scene_glb = preview(_last_output, globals().get('export_options') or {})
+    for part_data in parts_data:
+        if 'mesh' in part_data:
+            part_data['mesh'] = {key: to_js(array, create_pyproxies=False) for key, array in part_data['mesh'].items()}
+
+    window.sceneGlb = to_js(scene_glb, create_pyproxies=False) if scene_glb is not None else None
+
+    # Exports are cached on the parts, so re-apply the build cache budget now that they are known
+    if 'build_cache' in globals():
+        build_cache.trim()
+
+    # Store parts data for 3D viewer (list of parts with names, colors, and mesh buffers)
+    window.partsData = to_js(parts_data, create_pyproxies=False, dict_converter=Object.fromEntries)
+
+    # The page has its own copies now: drop the arrays and JS proxies this script left in globals
+    del parts_data, scene_glb
+    if 'part_data' in globals():
+        del part_data
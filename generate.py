@@ -1,4 +1,4 @@
-_custom_data=None ###DO NOT MODIFY
+_custom_data=globals().get('_custom_data') ###DO NOT MODIFY
 
 ## IMPORT LOCAL DEPENDS
 try:
@@ -34,9 +34,9 @@ index = {
             P('length', 'num', 80.0),
             P('width',  'num', 60.0),
             P('height', 'num', 10.0),
-            P('rotation', 'str', '( 0 , 0 , 0 )'),
-            P('align', 'str', "( Align.CENTER , Align.CENTER , Align.CENTER )"),
-            P('mode', 'str', 'Mode.ADD'),
+            P('rotation', 'vec', '( 0 , 0 , 0 )'),
+            P('align', 'enums', "( Align.CENTER , Align.CENTER , Align.CENTER )", enum='Align'),
+            P('mode', 'enum', 'Mode.ADD', enum='Mode'),
             incl,
     ],
 
@@ -46,9 +46,9 @@ index = {
             P('top_radius', 'num', 0),
             P('height', 'num', 100.0),
             P('arc_size', 'num', 360.0),
-            P('rotation', 'str', '( 0 , 0 , 0 )'),
-            P('align', 'str', "( Align.CENTER , Align.CENTER , Align.CENTER )"),
-            P('mode', 'str', 'Mode.ADD'),
+            P('rotation', 'vec', '( 0 , 0 , 0 )'),
+            P('align', 'enums', "( Align.CENTER , Align.CENTER , Align.CENTER )", enum='Align'),
+            P('mode', 'enum', 'Mode.ADD', enum='Mode'),
             incl,
     ],
 
@@ -57,9 +57,9 @@ index = {
             P('radius', 'num',25.0),
             P('height', 'num', 100.0),
             P('arc_size', 'num', 360.0),
-            P('rotation', 'str', '( 0 , 0 , 0 )'),
-            P('align', 'str', "( Align.CENTER , Align.CENTER , Align.CENTER )"),
-            P('mode', 'str', 'Mode.ADD'),
+            P('rotation', 'vec', '( 0 , 0 , 0 )'),
+            P('align', 'enums', "( Align.CENTER , Align.CENTER , Align.CENTER )", enum='Align'),
+            P('mode', 'enum', 'Mode.ADD', enum='Mode'),
             incl,
     ],
 
@@ -69,9 +69,9 @@ index = {
             P('arc_size1', 'num', -90.0),
             P('arc_size2', 'num', 90.0),
             P('arc_size3', 'num', 360.0),
-            P('rotation', 'str', '( 0 , 0 , 0 )'),
-            P('align', 'str', "( Align.CENTER , Align.CENTER , Align.CENTER )"),
-            P('mode', 'str', 'Mode.ADD'),
+            P('rotation', 'vec', '( 0 , 0 , 0 )'),
+            P('align', 'enums', "( Align.CENTER , Align.CENTER , Align.CENTER )", enum='Align'),
+            P('mode', 'enum', 'Mode.ADD', enum='Mode'),
             incl,
     ],
 
@@ -81,9 +81,9 @@ index = {
             P('minor_radius', 'num', 10.0),
             P('major_arc_size', 'num', 0),
             P('minor_arc_size', 'num', 360),
-            # P('rotation', 'str', '( 0 , 0 , 0 )'),
-            P('align', 'str', "( Align.CENTER , Align.CENTER , Align.CENTER )"),
-            P('mode', 'str', 'Mode.ADD'),
+            # P('rotation', 'vec', '( 0 , 0 , 0 )'),
+            P('align', 'enums', "( Align.CENTER , Align.CENTER , Align.CENTER )", enum='Align'),
+            P('mode', 'enum', 'Mode.ADD', enum='Mode'),
             incl,
     ],
 
@@ -96,9 +96,9 @@ index = {
             P('zmin', 'num', 30.0),
             P('xmax', 'num', 60.0),
             P('zmax', 'num', 60.0),
-            P('rotation', 'str', '( 0 , 0 , 0 )'),
-            P('align', 'str', "( Align.CENTER , Align.CENTER , Align.CENTER )"),
-            P('mode', 'str', 'Mode.ADD'),
+            P('rotation', 'vec', '( 0 , 0 , 0 )'),
+            P('align', 'enums', "( Align.CENTER , Align.CENTER , Align.CENTER )", enum='Align'),
+            P('mode', 'enum', 'Mode.ADD', enum='Mode'),
             incl,
     ],
    
@@ -110,64 +110,107 @@ index = {
 
 
 # LOAD JSON 
-if _custom_data:
-    p = loadParam(_custom_data)
+def params(data):
+    """The ParameterGroup for data: full parameter JSON, or only the changed values
+    applied to the previous build's group. None gives the defaults."""
+    if data:
+        with perf.phase('parameters'):
+            if type(data) == str:
+                data = loads(data)
+            # checked before a delta changes the group of the previous build
+            shape = data.get('changes', {}).get('shape') if 'v' in data else None
+            if shape is not None and shape not in index:
+                raise ValueError(f"Unknown shape '{shape}'. Expected one of: {list(index)}")
+            p = loadParam(data, globals().get('p'))
+
+        # REBUILD PARAMS
+        if p.shape.value != p.shape.prev:
+            p = ParameterGroup([param.copy() for param in index[p.shape.value]])
+        return p
+
+    # INITIAL BUILD
+    return ParameterGroup([param.copy() for param in index['wedge']])
 
-    # REBUILD PARAMS
-    if p.shape.value != p.shape.prev:
-        new = p.shape.value 
-        del(p)  
-        p = ParameterGroup(index[new])
-
-# INITIAL BUILD
-else:
-    p = ParameterGroup (index['wedge'])
-
-# EXPORT PARAMETERS TO VIEWER
-if WEBPY:
-    window.jsonData = p.dumps() # type: ignore
-else:
-    pass# print(p.dumps())
 
 # #BUILD MODEL
-with BuildPart() as box:
-    if p.include_companion.value == True: 
-        Box(50,50,50)
+# Stages re-run only when the parameters they read change: the companion box, the
+# aligned primitive (shape and sizes), its rotation, then the combination with mode.
+stages = StageGraph()
+SIZES = sorted({param.name for params in index.values() for param in params} - {'include_companion', 'rotation', 'mode'})
 
+@stages.stage(reads=['include_companion'])
+def companion(p):
+    return Box(50,50,50) if p.include_companion.value == True else None
+
+@stages.stage(reads=SIZES)
+def primitive(p):
     match p.shape.value:
         case 'box':    
-            Box(length = p.length.value,
+            return Box(length = p.length.value,
             width = p.width.value, 
             height = p.height.value,
-            rotation= eval(p.rotation.value),
-            align = eval(p.align.value),
-            mode = eval(p.mode.value)
+            align = p.align.converted,
             )
 
         case 'cone':
-            Cone(p.bottom_radius.value, p.top_radius.value, p.height.value,p.arc_size.value, eval(p.rotation.value), eval(p.align.value), eval(p.mode.value)       )
-        
+            return Cone(p.bottom_radius.value, p.top_radius.value, p.height.value,p.arc_size.value, align=p.align.converted)
+    
 
         case 'cylinder':
-            Cylinder(p.radius.value,  p.height.value,p.arc_size.value, eval(p.rotation.value), eval(p.align.value), eval(p.mode.value)       )
-        
+            return Cylinder(p.radius.value,  p.height.value,p.arc_size.value, align=p.align.converted)
+    
         case 'sphere':
-            Sphere(p.radius.value,  p.arc_size1.value,  p.arc_size2.value,  p.arc_size3.value, eval(p.rotation.value), eval(p.align.value), eval(p.mode.value)       )
-        
+            return Sphere(p.radius.value,  p.arc_size1.value,  p.arc_size2.value,  p.arc_size3.value, align=p.align.converted)
+    
         case 'torus':
             ## can't rotate by float???
-            Torus(p.major_radius.value,p.minor_radius.value, p.major_arc_size.value, p.minor_arc_size.value, align=eval(p.align.value), mode=eval(p.mode.value))
-        
+            return Torus(p.major_radius.value,p.minor_radius.value, p.major_arc_size.value, p.minor_arc_size.value, align=p.align.converted)
+    
         case 'wedge':
-            Wedge(p.xsize.value, p.ysize.value, p.zsize.value, p.xmin.value, p.zmin.value, p.xmax.value, p.zmax.value, align=eval(p.align.value), mode=eval(p.mode.value))
-        
-        
-        case _: pass
-
-
-
-## OUTPUT SHAPE TO VIEWER
-output = []
-output.append({"name": "box", "part": box.part.rotate(Axis.X, -90), "color": "#10b981", "opacity": 0.75})
-
-
+            return Wedge(p.xsize.value, p.ysize.value, p.zsize.value, p.xmin.value, p.zmin.value, p.xmax.value, p.zmax.value, align=p.align.converted)
+    
+        case _: return None
+
+@stages.stage(reads=['shape', 'rotation'], after=['primitive'])
+def rotated(p, primitive):
+    # torus and wedge are built without rotation
+    if primitive is None or p.shape.value not in ('box', 'cone', 'cylinder', 'sphere'):
+        return primitive
+    return primitive.moved(Rotation(*p.rotation.converted))
+
+@stages.stage(reads=['mode'], after=['companion', 'rotated'])
+def combined(p, companion, rotated):
+    with BuildPart() as box:
+        if companion is not None:
+            add(companion)
+        if rotated is not None:
+            add(rotated, mode = p.mode.converted)
+    return box.part
+
+
+def build(p):
+    # reuse the build if this exact parameter set was built before
+    output = build_cache.get(p)
+    if output is None:
+        with perf.phase('build'):
+            part = stages.run(p)
+
+        ## OUTPUT SHAPE TO VIEWER
+        output = []
+        output.append({"name": "box", "part": part.rotate(Axis.X, -90), "color": "#10b981", "opacity": 0.75})
+        build_cache.put(p, output)
+        print(stages)
+
+    print(build_cache)
+    return output
+
+
+# RUN (a ModelSession calls params() and build() itself, keeping this namespace between builds)
+if not globals().get('_session'):
+    p = params(_custom_data)
+
+    # EXPORT PARAMETERS TO VIEWER
+    if WEBPY:
+        window.jsonData = p.dumps() # type: ignore
+
+    output = build(p)
@@ -10,8 +10,16 @@ except Exception:
 
 # from make_plus import export_gltf_plus
 
-# import os
+import hashlib
+import io
+import json
+import os
+import time
 import subprocess as sp
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from copy import copy
+from multiprocessing.connection import Client
 from pathlib import Path
 from os import name as osname
 
@@ -35,32 +43,80 @@ print(f"Detected {osname}")
 
 home = str(Path.home())
 
-def posixRunning():
+ABCQ_EXE = {
+    OS.NT: home + "\\ABCQ\\abcq.exe",
+    OS.POSIX: "/home/will/abcq/0.1.1/ABCQ/build/Desktop-Debug/abcq",
+}
+
+# ABCQ started by launch() is tracked with a pidfile, so checking it needs no process table scan
+ABCQ_DIR = os.path.join(home, '.abcq')
+PIDFILE = os.path.join(ABCQ_DIR, 'abcq.pid')
+
+def readPid():
     try:
-        tasklist = sp.check_output(['ps', 'aux', ], encoding='utf-8')
-    except Exception:
-        print("couldn't obtain tasklist")
-        return True
-    
-    return "/home/will/abcq/0.1.1/ABCQ/build/Desktop-Debug/abcq" in tasklist
+        with open(PIDFILE) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def writePid(pid):
+    os.makedirs(ABCQ_DIR, exist_ok=True)
+    with open(PIDFILE, 'w') as f:
+        f.write(str(pid))
 
+def pidExecutable(pid):
+    """Executable of a running process, or None if there is no such process."""
+    if osname == OS.NT:
+        import ctypes
+        from ctypes import wintypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return None
+        try:
+            code = wintypes.DWORD()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+            if code.value != 259:  # STILL_ACTIVE
+                return None
+            buffer = ctypes.create_unicode_buffer(1024)
+            size = wintypes.DWORD(len(buffer))
+            if not kernel32.QueryFullProcessImageNameW(handle, 0, buffer, ctypes.byref(size)):
+                return None
+            return buffer.value
+        finally:
+            kernel32.CloseHandle(handle)
 
-def winRunning():
     try:
-        tasklist = sp.check_output(['tasklist'], encoding='utf-8')
-        return 'abcq.exe' in tasklist
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            return f.read().split(b'\0')[0].decode(errors='replace') or None
+    except FileNotFoundError:
+        if os.path.isdir('/proc'):
+            return None
+    except OSError:
+        return None
+    # no /proc (macOS): ask about this one pid only
+    try:
+        return sp.check_output(['ps', '-p', str(pid), '-o', 'comm='], encoding='utf-8').strip() or None
     except Exception:
-        return False
+        return None
+
+def pidIsAbcq(pid):
+    # the pid of an ABCQ that exited may have been reused by another program
+    executable = pidExecutable(pid)
+    return executable is not None and os.path.basename(executable).lower() == os.path.basename(ABCQ_EXE.get(osname, 'abcq')).lower()
 
 def running():
-    match osname:
-        case OS.NT:
-            return winRunning()
-        case OS.POSIX:
-            return posixRunning()
-        case _:
-            print("OS NOT SUPPORTED")
-            return True
+    pid = readPid()
+    if pid is None:
+        return False
+    if pidIsAbcq(pid):
+        return True
+    # stale pidfile: ABCQ exited
+    try:
+        os.remove(PIDFILE)
+    except OSError:
+        pass
+    return False
 
 def launch(path, force=False):
     if force or not running():
@@ -68,8 +124,8 @@ def launch(path, force=False):
             case OS.NT:
 
                 try:
-                    print(home+"\\ABCQ\\abcq.exe")
-                    sp.Popen([home + "\\ABCQ\\abcq.exe", path])
+                    print(ABCQ_EXE[OS.NT])
+                    writePid(sp.Popen([ABCQ_EXE[OS.NT], path]).pid)
                     return True
                 except Exception:
                     print('failed to open')
@@ -78,8 +134,8 @@ def launch(path, force=False):
             case OS.POSIX:
                 
                 try:
-                    print("/home/will/abcq/0.1.1/ABCQ/build/Desktop-Debug/abcq")
-                    sp.Popen(["/home/will/abcq/0.1.1/ABCQ/build/Desktop-Debug/abcq", path])
+                    print(ABCQ_EXE[OS.POSIX])
+                    writePid(sp.Popen([ABCQ_EXE[OS.POSIX], path]).pid)
                     return True
                 except Exception:
                     print('failed to open')
@@ -98,6 +154,150 @@ def hex2rgba(hex):
     
     return (r, g, b, a)
 
+def set_color(part, color):
+    if type(color) == str:
+        
+        if color[0] in ['#','/']:
+            part.color = Color(hex2rgba(color[1:]))
+        else:
+            part.color = Color(color)
+
+    elif type(color) == Color:
+        part.color = color
+
+    elif type(color) == tuple:
+        part.color = Color(*color)
+
+    else:
+        print("wrong color type")
+
+
+def full_path(fn="abcq", ext="glb", dir=None):
+    if ext[0] != ".":
+        ext = "." + ext
+    
+    if "." in fn:
+        ext = ""
+    
+    if dir is None:
+        dir = str(Path.home())
+
+    if dir[-1] != "/" or "\\":
+        dir = dir + "/"
+
+    return dir+fn+ext
+
+
+# write to a temporary file next to the target, then rename it: a reader (ABCQ) never sees half a file
+def write_part(part, fullpath, bin=True, ld=0.001, ad=0.1):
+    folder, name = os.path.split(fullpath)
+    ext = os.path.splitext(name)[1]
+    tmppath = os.path.join(folder, f".{name}.{os.getpid()}.tmp{ext}")
+
+    try:
+        match ext[1:]:
+            case 'stl':
+                print(f"Render: {export_stl(part,tmppath,ld,ad,bin)}")
+            case 'brep':
+                print(export_brep(part,tmppath))
+            case 'step':
+                print(export_step(part,tmppath))
+            # case 'plus':
+            #     export_gltf_plus(part,fullpath,binary=bin,linear_deflection=ld,angular_deflection=ad)
+            case _:
+                export_gltf(
+                    part,
+                    tmppath,
+                    binary=bin,
+                    linear_deflection=ld,
+                    angular_deflection=ad
+                )
+        os.replace(tmppath, fullpath)
+    finally:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+
+
+def rgba(color):
+    if color is None or type(color) == tuple:
+        return color
+    if type(color) == str and color[0] in ['#','/']:
+        return hex2rgba(color[1:])
+    return tuple(Color(color) if type(color) == str else color)
+
+
+# Channel to a running ABCQ: a Unix socket, or a named pipe on Windows. ABCQ listens on it
+# while it runs; each message is a length-prefixed frame (multiprocessing.connection, no authkey):
+#   {"op": "part", "name": ..., "format": "brep", "color": [r, g, b, a] | null, "bytes": n}
+#     followed by a frame with the n bytes of the part
+#   {"op": "scene", "names": [...]}   every part of the scene; the viewer drops the others
+# Only the parts that changed since the last push on this connection are sent.
+if osname == OS.NT:
+    ABCQ_ADDRESS, ABCQ_FAMILY = r'\\.\pipe\abcq', 'AF_PIPE'
+else:
+    ABCQ_ADDRESS, ABCQ_FAMILY = os.path.join(ABCQ_DIR, 'abcq.sock'), 'AF_UNIX'
+
+class Viewer:
+    def __init__(self, address=ABCQ_ADDRESS, family=ABCQ_FAMILY):
+        self.address = address
+        self.family = family
+        self.conn = None
+        self.sent = {}  # part name -> digest of what the viewer has
+
+    def connect(self):
+        if self.conn is None:
+            if self.family == 'AF_UNIX' and not os.path.exists(self.address):
+                return None
+            try:
+                self.conn = Client(self.address, self.family)
+            except OSError:
+                return None
+            self.sent = {}
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = None
+        self.sent = {}
+
+    def push(self, parts):
+        """parts: {name: (part, color)}. False when no viewer is listening."""
+        conn = self.connect()
+        if conn is None:
+            return False
+
+        changed = []
+        for name, (part, color) in parts.items():
+            data = io.BytesIO()
+            export_brep(part, data)
+            data = data.getvalue()
+            color = rgba(color)
+            digest = hashlib.sha1(data + repr(color).encode()).hexdigest()
+            if self.sent.get(name) != digest:
+                changed.append((name, digest, color, data))
+
+        try:
+            for name, digest, color, data in changed:
+                conn.send_bytes(json.dumps({'op': 'part', 'name': name, 'format': 'brep', 'color': color, 'bytes': len(data)}).encode())
+                conn.send_bytes(data)
+            conn.send_bytes(json.dumps({'op': 'scene', 'names': list(parts)}).encode())
+        except OSError:
+            # the viewer went away: the caller falls back to files and launching
+            self.close()
+            return False
+
+        self.sent = {name: digest for name, digest in self.sent.items() if name in parts}
+        self.sent.update((name, digest) for name, digest, _, _ in changed)
+        print(f"Pushed {len(changed)}/{len(parts)} changed part(s) to ABCQ")
+        return True
+
+viewer = Viewer()
+
+# formats only written for viewing: not needed when the parts were pushed
+VIEW_FORMATS = ('glb', 'gltf')
+
+
 #export a b123d part
 def make(part,
         fn= "abcq",
@@ -110,65 +310,115 @@ def make(part,
         ad=0.1,
         start=True,
         force = False,
-        plus = False
+        plus = False,
+        push = True
         ):
 
-    
-    if ext[0] != ".":
-        ext = "." + ext
-    
-    if "." in fn:
-        ext = ""
-    
-    if dir is None:
-        dir = str(Path.home())
-
-    if dir[-1] != "/" or "\\":
-        dir = dir + "/"
-
-    fullpath = dir+fn+ext
+    fullpath = full_path(fn, ext, dir)
     print(fullpath)
 
     if type(part) == BuildPart:
         part = part.part
     
     if color is not None:
-        
-        if type(color) == str:
-            
-            if color[0] in ['#','/']:
-                part.color = Color(hex2rgba(color[1:]))
-            else:
-                part.color = Color(color)
+        set_color(part, color)
 
-        elif type(color) == Color:
-            part.color = color
+    fmt = fullpath.rsplit(".", 1)[-1]
+    print(fmt)
 
-        else:
-            print("wrong color type")
-
-    print(ext[1:])
-
-    match ext[1:]:
-        case 'stl':
-            print(f"Render: {export_stl(part,fullpath,ld,ad,bin)}")
-        case 'brep':
-            print(export_brep(part,fullpath))
-        # case 'plus':
-        #     export_gltf_plus(part,fullpath,binary=bin,linear_deflection=ld,angular_deflection=ad)
-        case _:
-            export_gltf(
-                part,
-                fullpath,
-                binary=bin,
-                linear_deflection=ld,
-                angular_deflection=ad
-            )
+    # a running ABCQ gets the part over its channel; files and launching are the fallback
+    pushed = push and not force and viewer.push({fn: (part, getattr(part, 'color', None))})
+    if not pushed or fmt not in VIEW_FORMATS:
+        write_part(part, fullpath, bin, ld, ad)
         
-    if start or force:
+    if (start or force) and not pushed:
         if launch(fullpath, force=force): print("Opening ABCQ...") 
         else: print('ABCQ Already Running')
-        
 
 
- 
+# worker process of make_all: export one part, timed
+def _make_one(job):
+    t0 = time.perf_counter()
+    try:
+        part = job['part']
+        if job['color'] is not None:
+            set_color(part, job['color'])
+        with redirect_stdout(io.StringIO()):
+            write_part(part, job['path'], job['bin'], job['ld'], job['ad'])
+        return {'path': job['path'], 'ms': round((time.perf_counter() - t0) * 1000, 1), 'bytes': os.path.getsize(job['path'])}
+    except Exception as e:
+        return {'path': job['path'], 'ms': round((time.perf_counter() - t0) * 1000, 1), 'error': str(e) or type(e).__name__}
+
+
+#export many b123d parts at once, one process per core
+def make_all(parts,
+        ext = "glb",
+        dir= None,
+        bin=True,
+        ld=0.001,
+        ad=0.1,
+        workers=None,
+        start=True,
+        force = False,
+        push = True,
+        ):
+    """parts: a list of parts, or of dicts {part, fn, ext, color, bin, ld, ad} overriding
+    the defaults for that part (fn defaults to part0, part1, ...). Each file is written
+    atomically. Returns one {path, ms, bytes} (or {path, ms, error}) per part.
+
+    With push, a running ABCQ gets the changed parts over its channel instead, and
+    only the files in other formats than glb/gltf are written.
+
+    On Windows, call it under `if __name__ == "__main__":` (worker processes re-import the script).
+    """
+    jobs = []
+    for i, item in enumerate(parts):
+        if type(item) != dict:
+            item = {'part': item}
+
+        part = item['part']
+        if type(part) == BuildPart:
+            part = part.part
+
+        color = item.get('color')
+        if color is None and getattr(part, 'color', None) is not None:
+            color = tuple(part.color)
+        if type(color) == Color:
+            color = tuple(color)
+        # OCCT colors do not pickle: send a copy without it, the worker sets it again
+        part = copy(part)
+        part.color = None
+
+        jobs.append({
+            'part': part,
+            'path': full_path(item.get('fn', f"part{i}"), item.get('ext', ext), item.get('dir', dir)),
+            'color': color,
+            'bin': item.get('bin', bin),
+            'ld': item.get('ld', ld),
+            'ad': item.get('ad', ad),
+        })
+
+    pushed = push and not force and viewer.push({os.path.basename(job['path']).rsplit('.', 1)[0]: (job['part'], job['color']) for job in jobs})
+    if pushed:
+        jobs = [job for job in jobs if job['path'].rsplit('.', 1)[-1] not in VIEW_FORMATS]
+
+    t0 = time.perf_counter()
+    workers = min(workers or os.cpu_count() or 1, len(jobs)) or 1
+    results = []
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_make_one, jobs))
+
+    for r in results:
+        if 'error' in r:
+            print(f"{r['path']}: failed after {r['ms']} ms: {r['error']}")
+        else:
+            print(f"{r['path']}: {r['bytes']} bytes in {r['ms']} ms")
+    print(f"{len(results)} part(s) in {time.perf_counter() - t0:.2f} s on {workers} process(es)")
+
+    done = [r['path'] for r in results if 'error' not in r]
+    if done and (start or force) and not pushed:
+        if launch(done[0], force=force): print("Opening ABCQ...") 
+        else: print('ABCQ Already Running')
+
+    return results
@@ -0,0 +1,124 @@
+// Content-addressed store of build results in IndexedDB, shared by every tab and session.
+// Keys are the SHA-256 of [generate.py, export.py, parameter values, options] (see key());
+// values are what the viewer and the downloads need (partsData, sceneGlb, jsonData or
+// exported Blobs), so a configuration built before is shown without running Python at all.
+// The store is bounded by budgetBytes; the least recently used entries are evicted first.
+const DB_NAME = 'build123d-artifacts';
+const STORE = 'artifacts';
+// size and last use of each artifact, kept apart so eviction never loads the artifacts
+const ENTRIES = 'entries';
+// part of every key: raised when stored results can no longer be trusted (2: builds before
+// ModelSession dropped its caches on a new generate.py)
+const KEY_VERSION = 2;
+
+// Approximate size of a stored value: its buffers, Blobs and strings
+function sizeOf(value) {
+    if (value === null || value === undefined) return 0;
+    if (typeof value === 'string') return value.length * 2;
+    if (value instanceof Blob) return value.size;
+    if (ArrayBuffer.isView(value) || value instanceof ArrayBuffer) return value.byteLength;
+    if (Array.isArray(value)) return value.reduce((total, item) => total + sizeOf(item), 0);
+    if (typeof value === 'object') return Object.values(value).reduce((total, item) => total + sizeOf(item), 0);
+    return 8;
+}
+
+function promisify(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+export class ArtifactStore {
+    constructor(budgetBytes = 256 * 1024 * 1024) {
+        this.budgetBytes = budgetBytes;
+        this.hits = 0;
+        this.misses = 0;
+        this.db = null;
+        this.opening = null;
+        this.enabled = typeof indexedDB !== 'undefined' && !!(globalThis.crypto && crypto.subtle)
+            && !new URLSearchParams(window.location.search).has('nocache');
+    }
+
+    async open() {
+        if (!this.enabled) return null;
+        if (!this.opening) {
+            const request = indexedDB.open(DB_NAME, 1);
+            request.onupgradeneeded = () => {
+                request.result.createObjectStore(STORE, { keyPath: 'key' });
+                request.result.createObjectStore(ENTRIES, { keyPath: 'key' }).createIndex('usedAt', 'usedAt');
+            };
+            this.opening = promisify(request).then(db => (this.db = db)).catch(error => {
+                // private browsing, blocked storage...: run without the store
+                console.warn('Artifact store unavailable:', error);
+                this.enabled = false;
+                return null;
+            });
+        }
+        return this.opening;
+    }
+
+    // Hex SHA-256 of the JSON of parts
+    async key(...parts) {
+        if (!this.enabled) return null;
+        const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(JSON.stringify([KEY_VERSION, ...parts])));
+        return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+    }
+
+    async get(key) {
+        const db = key && await this.open();
+        if (!db) return null;
+
+        try {
+            const transaction = db.transaction([STORE, ENTRIES], 'readwrite');
+            const artifact = await promisify(transaction.objectStore(STORE).get(key));
+            if (!artifact) {
+                this.misses++;
+                return null;
+            }
+            const entries = transaction.objectStore(ENTRIES);
+            const entry = await promisify(entries.get(key));
+            if (entry) {
+                entry.usedAt = Date.now();
+                entries.put(entry);
+            }
+            this.hits++;
+            return artifact.value;
+        } catch (error) {
+            console.warn('Artifact store read failed:', error);
+            return null;
+        }
+    }
+
+    async put(key, value) {
+        const db = key && await this.open();
+        if (!db) return;
+
+        try {
+            const transaction = db.transaction([STORE, ENTRIES], 'readwrite');
+            transaction.objectStore(STORE).put({ key, value });
+            await promisify(transaction.objectStore(ENTRIES).put({ key, bytes: sizeOf(value), usedAt: Date.now() }));
+            await this.evict();
+        } catch (error) {
+            // e.g. over the browser's quota: the build result is still shown, just not stored
+            console.warn('Artifact store write failed:', error);
+        }
+    }
+
+    // Delete the least recently used entries beyond the budget
+    async evict() {
+        const transaction = this.db.transaction([STORE, ENTRIES], 'readwrite');
+        const entries = await promisify(transaction.objectStore(ENTRIES).index('usedAt').getAll());
+        let total = entries.reduce((sum, entry) => sum + entry.bytes, 0);
+        for (const entry of entries) {
+            if (total <= this.budgetBytes) break;
+            transaction.objectStore(STORE).delete(entry.key);
+            transaction.objectStore(ENTRIES).delete(entry.key);
+            total -= entry.bytes;
+        }
+    }
+
+    stats() {
+        return { enabled: this.enabled, hits: this.hits, misses: this.misses, budgetBytes: this.budgetBytes };
+    }
+}
@@ -48,13 +48,38 @@ export class FileDownloads {
         this.downloadBlob(blob, filename);
     }
 
+    // Fetch a format from the Python runtime the first time it is requested
+    async ensureFormat(dataKey) {
+        if (this.currentParts.every(part => part[dataKey])) {
+            return;
+        }
+
+        if (!this.pythonRuntime) {
+            return;
+        }
+
+        const exportedParts = await this.pythonRuntime.exportFormat(dataKey);
+        this.currentParts = this.currentParts.map((part, index) => ({
+            ...part,
+            [dataKey]: exportedParts[index] ? exportedParts[index][dataKey] : part[dataKey]
+        }));
+    }
+
     // Generic method to handle part-based downloads
-    downloadParts(extension, dataKey) {
+    async downloadParts(extension, dataKey) {
         if (this.currentParts.length === 0) {
             alert(`No ${extension.toUpperCase()} files available for download`);
             return;
         }
 
+        try {
+            await this.ensureFormat(dataKey);
+        } catch (error) {
+            console.error(`Failed to export ${extension.toUpperCase()}:`, error);
+            alert(`Failed to export ${extension.toUpperCase()} files: ${error.message}`);
+            return;
+        }
+
         const availableParts = this.currentParts.filter(part => part[dataKey]);
         
         if (availableParts.length === 0) {
@@ -0,0 +1,51 @@
+// Hot reload of the model scripts, pushed by server.py over Server-Sent Events (GET /events).
+// The server sends the content hash of every watched script when the page connects
+// ("scripts") and whenever one changes ("change"); onChange(file, hash) is called only
+// when a hash differs from the one the page last loaded, so touching or re-saving a
+// file unchanged never triggers a reload. Reconnects after a dropped connection compare
+// the hashes again, so edits made in between are not missed.
+export class HotReload {
+    constructor(url = 'events') {
+        this.url = url;
+        this.hashes = {};
+        this.onChange = null;
+        this.source = null;
+    }
+
+    start() {
+        if (typeof EventSource === 'undefined' || this.source) return;
+
+        this.source = new EventSource(this.url);
+        this.source.addEventListener('scripts', event => {
+            Object.entries(JSON.parse(event.data)).forEach(([file, hash]) => this.update(file, hash));
+        });
+        this.source.addEventListener('change', event => {
+            const { file, hash } = JSON.parse(event.data);
+            this.update(file, hash);
+        });
+        this.source.onerror = () => {
+            // a server without /events (or without --watch) answers 404: stop trying
+            if (this.source.readyState === EventSource.CLOSED) {
+                console.log('Hot reload unavailable (server.py without --watch)');
+                this.stop();
+            }
+        };
+    }
+
+    stop() {
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+    }
+
+    update(file, hash) {
+        const known = this.hashes[file];
+        this.hashes[file] = hash;
+        // the first hash of a file is the version the page loaded
+        if (known === undefined || known === hash || hash === null) return;
+        if (this.onChange) {
+            this.onChange(file, hash);
+        }
+    }
+}
@@ -4,6 +4,12 @@ export class ParameterHandler {
         this.parameterDefinitions = {};
         this.parameterInputs = {};
         this.basePythonScript = '';
+
+        // Values changed since the last build, sent as a { v: 1, changes } delta
+        this.pendingChanges = {};
+        this.syncedJsonData = null;
+        // Number parameter changed most recently, whose neighbouring steps are prefetched
+        this.lastTouched = null;
         this.reloadParamsButton = document.getElementById('reload-params');
         
         this.setupEventListeners();
@@ -48,7 +54,9 @@ export class ParameterHandler {
                 inputElement = this.createBooleanInput(param, label, inputContainer);
                 inputElement.addEventListener('change', () => {
                     this.parameterDefinitions.children[index].value = inputElement.checked
+                    this.pendingChanges[param.name] = inputElement.checked;
                     console.log( 'input det: ' + 'bool' )
+                    this.triggerLivePreview();
                 });
 
                 
@@ -58,7 +66,14 @@ export class ParameterHandler {
                 inputElement = this.createNumberInput(param, label, inputContainer);
                 inputContainer.oninput = () => {
                     this.parameterDefinitions.children[index].value = parseFloat(inputElement.value)
+                    if (!isNaN(parseFloat(inputElement.value))) {
+                        this.pendingChanges[param.name] = parseFloat(inputElement.value);
+                        this.lastTouched = param.name;
+                    }
                     console.log('input det: num')
+                    if (!isNaN(parseFloat(inputElement.value))) {
+                        this.triggerLivePreview();
+                    }
                 }
             } 
             else  {
@@ -70,6 +85,7 @@ export class ParameterHandler {
 
                 inputElement.addEventListener('input', () => {
                     this.parameterDefinitions.children[index].value = inputElement.value;
+                    this.pendingChanges[param.name] = inputElement.value;
                     console.log('input det: string' + inputElement.value) 
                 });
             } 
@@ -274,6 +290,8 @@ export class ParameterHandler {
             
             // Parse parameter definitions from the script
             this.parameterDefinitions = this.parseParameterDefinitions();
+            this.syncedJsonData = window.jsonData ?? null;
+            this.pendingChanges = {};
             
             // Generate dynamic input fields immediately
             this.generateParameterInputs();
@@ -306,6 +324,8 @@ export class ParameterHandler {
 
             // Parse parameter definitions from the script
             this.parameterDefinitions = this.parseParameterDefinitions();
+            this.syncedJsonData = window.jsonData ?? null;
+            this.pendingChanges = {};
             
             // Generate dynamic input fields immediately
             this.generateParameterInputs();
@@ -337,14 +357,15 @@ export class ParameterHandler {
     //     return existingValues;
     // }
 
-    // Helper method to refetch and parse script
+    // Fetch generate.py again once server.py reported a change (see HotReload). server.py
+    // serves it with no-cache and an ETag, so this revalidates rather than re-downloads;
+    // the parameter definitions follow from the next build's window.jsonData.
     async refetchAndParseScript() {
-        const response = await fetch('generate.py?' + Date.now()); // Cache-busting
-        const scriptContent = await response.text();
-        
-        // Parse new parameter definitions
-        this.parameterDefinitions = this.parseParameterDefinitions(scriptContent);
-        this.basePythonScript = scriptContent;
+        const response = await fetch('generate.py', { cache: 'no-cache' });
+        if (!response.ok) {
+            throw new Error(`Failed to fetch generate.py: ${response.status}`);
+        }
+        this.basePythonScript = await response.text();
     }
 
     // // Helper method to regenerate inputs and restore values
@@ -397,27 +418,70 @@ export class ParameterHandler {
     //     }
     // }
 
-    createParameterizedScript() {
-        let script = this.basePythonScript;
+    // Parameter JSON for the native build endpoint (null before the first build: use the defaults)
+    getCustomData() {
+        if (window.jsonData==null){
+            return null
+        }
+        return JSON.stringify(this.parameterDefinitions, null, 2);
+    }
+
+    // The values changed since the last call, in the delta protocol understood by loadParam()
+    takeChanges() {
+        const changes = { v: 1, changes: this.pendingChanges };
+        this.pendingChanges = {};
+        return changes;
+    }
 
+    hasPendingChanges() {
+        return Object.keys(this.pendingChanges).length > 0;
+    }
 
-        // no parameters have been initialized, so we return the python script who will always generate the init params.
-        if (window.jsonData==null){
-            return script
+    // The values one step above and below a number parameter, within the min/max/step its
+    // input was given (from P, or the defaults of createNumberInput)
+    neighbourValues(name) {
+        const input = this.parameterInputs[name];
+        const param = this.parameterDefinitions.children?.find(child => child.name === name);
+        if (!input || !param || param.type !== 'num' || typeof param.value !== 'number' || isNaN(param.value)) {
+            return [];
         }
 
-        const endMarker = '###DO NOT MODIFY';
-        const endMarkerIndex = script.indexOf(endMarker);
+        const min = parseFloat(input.min);
+        const max = parseFloat(input.max);
+        const step = parseFloat(input.step) || 1;
+        // round to the digits of the value and step, so 0.1 + 0.2 is the 0.3 the input produces
+        const digits = Math.max(...[param.value, step].map(x => (String(x).split('.')[1] || '').length));
+        return [param.value + step, param.value - step]
+            .map(value => Number(value.toFixed(digits)))
+            .filter(value => !(value < min) && !(value > max));
+    }
 
-        const jsonStr = JSON.stringify(this.parameterDefinitions, null, 2);
-        
-        if (endMarkerIndex !== -1) {
-        
-        script = `_custom_data='''${jsonStr}'''` +
-                script.substring(endMarkerIndex);
+    // Keep the parameter definitions returned by Python, only rebuilding the inputs
+    // when the set of parameters changed (so live editing does not lose focus)
+    syncParameterDefinitions() {
+        // Nothing to do when Python sent back the same JSON (e.g. a rebuild without changes)
+        if (window.jsonData === this.syncedJsonData) {
+            return;
         }
+        this.syncedJsonData = window.jsonData;
+
+        const definitions = this.parseParameterDefinitions();
+        const signature = (defs) => defs && defs.children
+            ? defs.children.map(param => `${param.name}:${param.type}`).join('|')
+            : '';
         
-        return script;
+        if (signature(definitions) === signature(this.parameterDefinitions)) {
+            this.parameterDefinitions = definitions;
+        } else {
+            this.reloadParameterDefinitions();
+        }
+    }
+
+    triggerLivePreview() {
+        // This will be set by the main script
+        if (this.onParameterInput) {
+            this.onParameterInput();
+        }
     }
 
     triggerGeneration() {
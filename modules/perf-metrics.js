@@ -0,0 +1,73 @@
+// Phase timings of builds, refines and exports, published as window.perfData:
+//   { startup, last, history }
+// startup is the worker's startup profile (empty for native builds). Each record is
+//   { kind, backend, quality, startedAt, totalMs, phases: [{ phase, ms, part? }], parts: [...] }
+// where phases measured here are merged with those reported by the Python scripts
+// (PhaseTimer in utils.py/setup.py), and parts carries per-part triangle counts and byte sizes.
+// Builds and refines also carry memory: the worker's WASM heap and ceiling (heapBytes,
+// ceilingBytes, whether the Python caches were just released) and the viewer's GPU resources.
+export class PerfMetrics {
+    constructor(historySize = 50) {
+        this.historySize = historySize;
+        this.startup = [];
+        this.history = [];
+        this.publish();
+    }
+
+    setStartup(profile) {
+        this.startup = profile || [];
+        this.publish();
+    }
+
+    start(kind, details = {}) {
+        return {
+            kind,
+            ...details,
+            startedAt: new Date().toISOString(),
+            totalMs: null,
+            phases: [],
+            parts: [],
+            t0: performance.now()
+        };
+    }
+
+    phase(record, phase, ms) {
+        record.phases.push({ phase, ms: Math.round(ms * 100) / 100 });
+    }
+
+    async measure(record, phase, fn) {
+        const start = performance.now();
+        try {
+            return await fn();
+        } finally {
+            this.phase(record, phase, performance.now() - start);
+        }
+    }
+
+    // Merge the report of the Python side ({ phases, parts })
+    addReport(record, report) {
+        if (!report) return;
+        record.phases.push(...report.phases);
+        record.parts = report.parts;
+    }
+
+    finish(record) {
+        record.totalMs = Math.round((performance.now() - record.t0) * 100) / 100;
+        delete record.t0;
+
+        this.history.push(record);
+        if (this.history.length > this.historySize) {
+            this.history.shift();
+        }
+        this.publish();
+        return record;
+    }
+
+    publish() {
+        window.perfData = {
+            startup: this.startup,
+            last: this.history[this.history.length - 1] || null,
+            history: this.history
+        };
+    }
+}
@@ -1,25 +1,255 @@
+import { ArtifactStore } from './artifact-store.js';
+
+// Native build endpoint of server.py --native (see native.py for the response frame)
+const NATIVE_BUILD_URL = new URL('../build', import.meta.url);
+const EXPORT_URL = new URL('../export.py', import.meta.url);
+
+const TYPED_ARRAYS = {
+    float32: Float32Array,
+    uint32: Uint32Array,
+    uint16: Uint16Array,
+    uint8: Uint8Array
+};
+
+// Worker requests answered at once, without waiting for running Python
+const IMMEDIATE_REQUESTS = new Set(['init', 'stats', 'cancel']);
+
+// The endpoint is missing or unusable: switch to Pyodide
+class NativeUnavailableError extends Error {}
+
+// A newer build request replaced this one before its result was shown
+export class BuildCancelledError extends Error {
+    constructor(message = 'Build superseded by a newer request') {
+        super(message);
+        this.name = 'BuildCancelledError';
+    }
+}
+
+// Split a /build response frame into its header, with buffer references replaced by typed array views
+function decodeFrame(frame) {
+    const headerLength = new DataView(frame).getUint32(0, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(frame, 4, headerLength)));
+
+    const resolve = (value) => {
+        if (Array.isArray(value)) {
+            return value.map(resolve);
+        }
+        if (value && typeof value === 'object') {
+            if (typeof value.buffer === 'number' && value.dtype in TYPED_ARRAYS) {
+                const [offset, length] = header.buffers[value.buffer];
+                const TypedArray = TYPED_ARRAYS[value.dtype];
+                return new TypedArray(frame, offset, length / TypedArray.BYTES_PER_ELEMENT);
+            }
+            return Object.fromEntries(Object.entries(value).map(([key, item]) => [key, resolve(item)]));
+        }
+        return value;
+    };
+
+    const { buffers, ...result } = header;
+    return resolve(result);
+}
+
+// The values of a full parameter JSON, so labels or ranges do not change artifact keys
+function parameterValues(customData) {
+    try {
+        const data = JSON.parse(customData);
+        if (data && Array.isArray(data.children)) {
+            return Object.fromEntries(data.children.map(param => [param.name, param.value]));
+        }
+    } catch (error) {
+        // not JSON: key on the text itself
+    }
+    return customData;
+}
+
 export class PythonRuntime {
     constructor(statusManager) {
-        this.pyodide = null;
+        this.worker = null;
         this.isInitialized = false;
         this.statusManager = statusManager;
+
+        // Builds go to the server's native endpoint when it has one, otherwise to Pyodide
+        this.native = false;
+        this.startupProfile = [];
+        this.perfMetrics = null; // set by the main script
+        this.lastCode = null;
+        this.lastCustomData = null;
+
+        // The worker keeps the ParameterGroup of its last successful build, so it can be sent
+        // just the changed values ({ v: 1, changes }) instead of the full parameter JSON
+        this.liveParams = false;
+
+        // Results of builds with the same scripts, parameter values and options are reused
+        // from IndexedDB; the backend then does not hold the displayed model (backendStale)
+        this.artifacts = new ArtifactStore();
+        this.exportSource = '';
+        this.backendStale = false;
+
+        // Ceiling of the worker's WASM heap (?memory=<MB>, default 2048): the worker drops its
+        // caches as it approaches it, and is replaced before the next build once it reaches it
+        const memoryMb = parseInt(new URLSearchParams(window.location.search).get('memory'), 10);
+        this.memoryCeiling = (memoryMb > 0 ? memoryMb : 2048) * 1024 * 1024;
+        this.memory = null; // last { heapBytes, ceilingBytes, released, restart } reported by the worker
+        this.restartPending = false;
+
+        // Builds go through scheduleBuild(): one runs at a time and only the latest waiting
+        // request is kept. A running build that a newer request supersedes is stopped at its
+        // next Python bytecode through Pyodide's interrupt buffer (a SharedArrayBuffer, so only
+        // when server.py's COOP/COEP headers make the page cross-origin isolated), or its
+        // native request is aborted; without either, its result is just discarded.
+        this.interruptBuffer = self.crossOriginIsolated && typeof SharedArrayBuffer !== 'undefined'
+            ? new Int32Array(new SharedArrayBuffer(4))
+            : null;
+        this.scheduled = null;      // { code, options, resolve, reject }
+        this.debounceTimer = null;
+        this.running = null;        // { superseded, controller }, a build or a prefetch
+        this.lane = Promise.resolve(); // the last Python request sent to the worker
+        this.inWorker = null;       // signal of the scheduled request the worker is running
+
+        // Seconds a prefetch may spend building the neighbouring values of a parameter
+        this.prefetchSeconds = 2;
+
+        // Pending worker requests by id
+        this.nextRequestId = 1;
+        this.pendingRequests = new Map();
+
+        // Options passed to export.py ('mesh' or 'glb' viewer payload, e.g. ?format=glb)
+        this.exportOptions = {
+            format: new URLSearchParams(window.location.search).get('format') || 'mesh'
+        };
     }
 
     async initialize() {
+        // export.py is part of every artifact key, and the worker runs this same text
+        this.exportSource = await this.fetchExportSource();
+
+        if (await this.probeNative()) {
+            this.native = true;
+            this.isInitialized = true;
+            this.statusManager.updateStatus('🚀 Native build server ready!', 'Native build server ready! 🚀', 'text-sm status-success');
+            return;
+        }
+
+        await this.startWorker();
+    }
+
+    async fetchExportSource() {
+        try {
+            const response = await fetch(EXPORT_URL, { cache: 'no-cache' });
+            return response.ok ? await response.text() : '';
+        } catch (error) {
+            return '';
+        }
+    }
+
+    // export.py changed on the server: new artifact keys, and the worker runs the new text
+    // (native builds read it from disk)
+    async reloadExport() {
+        this.exportSource = await this.fetchExportSource();
+        if (!this.native && this.worker) {
+            await this.request('reload-export', { source: this.exportSource });
+        }
+    }
+
+    // Is server.py running with --native?
+    async probeNative() {
+        try {
+            const response = await fetch(NATIVE_BUILD_URL, { cache: 'no-store' });
+            if (!response.ok) return false;
+            const info = await response.json();
+            return info.native === true;
+        } catch (error) {
+            return false;
+        }
+    }
+
+    // POST a build request to the native endpoint and decode the response frame
+    async nativeRequest(body, signal) {
+        let response;
         try {
-            this.statusManager.updateStatus('🔄 Loading Python WebAssembly runtime...', 'Loading Python WebAssembly runtime...', 'text-sm status-pulse');
-            this.pyodide = await loadPyodide();
-            
-            // Install common packages
-            this.statusManager.updateStatus('📦 Installing basic Python packages...', 'Installing basic Python packages...');
-            await this.pyodide.loadPackage(['numpy', 'matplotlib', 'pandas', 'micropip', 'typing-extensions']);
-            
-            // Run the setup script (installs build123d and other packages)
-            await this.runSetupScript();
-            
+            response = await fetch(NATIVE_BUILD_URL, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(body),
+                signal
+            });
+        } catch (error) {
+            if (error.name === 'AbortError') throw new BuildCancelledError();
+            throw new NativeUnavailableError(error.message);
+        }
+
+        if (response.status === 422) {
+            // The model itself failed: show its output, as the worker does
+            const failure = await response.json();
+            this.displayOutput('=== MODEL GENERATION OUTPUT ===', failure.output || '');
+            throw new Error(failure.error);
+        }
+        if (!response.ok) {
+            throw new NativeUnavailableError(`native build endpoint returned ${response.status}`);
+        }
+
+        let frame;
+        try {
+            frame = await response.arrayBuffer();
+        } catch (error) {
+            if (error.name === 'AbortError') throw new BuildCancelledError();
+            throw error;
+        }
+        const result = decodeFrame(frame);
+        this.displayOutput('=== MODEL GENERATION OUTPUT ===', result.generationOutput);
+        this.displayOutput('=== EXPORT PROCESS OUTPUT ===', result.exportOutput);
+        return result;
+    }
+
+    // The native endpoint went away: load Pyodide and replay the last build there
+    async fallBackToWorker(error) {
+        console.warn('Native build failed, falling back to Pyodide:', error.message);
+        this.native = false;
+        this.isInitialized = false;
+        await this.startWorker();
+    }
+
+    // Run a request natively if possible, otherwise (or if that fails) in the worker
+    async dispatch(type, payload, nativeBody, signal) {
+        if (this.native) {
+            try {
+                return await this.nativeRequest(nativeBody, signal);
+            } catch (error) {
+                if (!(error instanceof NativeUnavailableError)) throw error;
+                await this.fallBackToWorker(error);
+                if (type !== 'build' && this.lastCode !== null) {
+                    // refine and export-format work on the worker's last build
+                    await this.request('build', { code: this.lastCode, params: this.lastCustomData, quality: 'fine', exportOptions: this.exportOptions });
+                }
+            }
+        }
+        return this.request(type, payload, signal);
+    }
+
+    async startWorker() {
+        try {
+            // Pyodide, setup.py and the model scripts all run in a worker so the viewer never stalls
+            this.worker = new Worker(new URL('./python-worker.js', import.meta.url), { type: 'module' });
+            this.worker.onmessage = (event) => this.handleMessage(event.data);
+            this.worker.onerror = (event) => console.error('Python worker error:', event.message);
+
+            const { startupProfile } = await this.request('init', {
+                memoryCeiling: this.memoryCeiling,
+                interruptBuffer: this.interruptBuffer,
+                exportSource: this.exportSource
+            });
+            this.startupProfile = startupProfile;
+            console.table(startupProfile);
+            if (this.perfMetrics) {
+                this.perfMetrics.setStartup(startupProfile);
+            }
+
             this.isInitialized = true;
+            if (new URLSearchParams(window.location.search).has('freeze')) {
+                await this.downloadLock();
+            }
             this.statusManager.updateStatus('🚀 Python environment ready!', 'Python environment ready! 🚀', 'text-sm status-success');
-            
+
         } catch (error) {
             console.error('Failed to initialize Pyodide:', error);
             this.statusManager.updateStatus('❌ Failed to initialize Python environment: ' + error.message, 'Failed to initialize Python environment ❌', 'text-sm status-error');
@@ -27,25 +257,106 @@ export class PythonRuntime {
         }
     }
 
-    async runSetupScript() {
-        try {
-            this.statusManager.updateStatus('⚙️ Setting up Python environment and packages...', 'Setting up Python environment and packages...');
-            const response = await fetch('setup.py');
-            const setupScript = await response.text();
-            
-            // Run the setup script
-            await this.pyodide.runPythonAsync(setupScript);
-            
-            this.statusManager.updateStatus('✅ Python packages installed successfully!', 'Python packages installed successfully!');
-            
-        } catch (error) {
-            console.error('Failed to run setup script:', error);
-            this.statusManager.updateStatus('❌ Failed to set up Python environment: ' + error.message, 'Setup failed ❌', 'text-sm status-error');
-            throw new Error('Failed to set up Python environment: ' + error.message);
+    // Send a request to the worker and resolve with its response. Requests that run Python
+    // are sent one at a time (this.lane), so the worker only ever holds the one that
+    // interruptBuild() may stop; signal identifies a scheduled build or prefetch.
+    request(type, payload = {}, signal = null) {
+        if (IMMEDIATE_REQUESTS.has(type)) {
+            return this.post(type, payload);
         }
+
+        const sent = this.lane.then(() => {
+            // superseded while it waited: never started
+            if (signal && signal.aborted) throw new BuildCancelledError();
+            this.inWorker = signal;
+            return this.post(type, payload);
+        }).finally(() => {
+            if (this.inWorker === signal) {
+                this.inWorker = null;
+            }
+        });
+        this.lane = sent.catch(() => {});
+        return sent;
+    }
+
+    post(type, payload) {
+        const id = this.nextRequestId++;
+        return new Promise((resolve, reject) => {
+            this.pendingRequests.set(id, { resolve, reject });
+            this.worker.postMessage({ id, type, payload });
+        });
     }
 
-    async runCode(code) {
+    handleMessage(message) {
+        if (message.id === undefined) {
+            // Events pushed by the worker while it runs
+            if (message.type === 'status') {
+                this.statusManager.updateStatus(message.fullMessage, message.shortMessage, message.statusClass);
+            } else if (message.type === 'output') {
+                this.displayOutput(message.heading, message.output);
+            }
+            return;
+        }
+
+        const pending = this.pendingRequests.get(message.id);
+        if (!pending) return;
+        this.pendingRequests.delete(message.id);
+
+        if (message.ok) {
+            pending.resolve(message.result);
+        } else {
+            pending.reject(message.cancelled ? new BuildCancelledError() : new Error(message.error));
+        }
+    }
+
+    displayOutput(heading, output) {
+        this.statusManager.consoleManager.appendToConsole(heading);
+        output.split('\n').forEach(line => {
+            if (line.trim()) {
+                this.statusManager.consoleManager.appendToPythonConsole(line.trim());
+            }
+        });
+    }
+
+    // Record the worker's memory report; at the ceiling, replace the worker before the next build
+    trackMemory(memory) {
+        if (!memory) return;
+        this.memory = memory;
+        if (memory.released) {
+            console.log(`Python caches released at ${(memory.heapBytes / 1048576).toFixed(0)} MB of WASM heap`);
+        }
+        if (memory.restart) {
+            this.restartPending = true;
+        }
+    }
+
+    // A fresh worker is the only way to give a grown WASM heap back to the browser
+    async restartWorker() {
+        this.restartPending = false;
+        this.statusManager.updateStatus('♻️ Restarting the Python worker to free memory...', 'Restarting Python to free memory ♻️', 'text-sm status-pulse');
+
+        this.worker.terminate();
+        this.worker = null;
+        this.pendingRequests.forEach(({ reject }) => reject(new Error('Python worker restarted')));
+        this.pendingRequests.clear();
+        this.isInitialized = false;
+
+        await this.startWorker();
+        // the new worker holds no model and no parameters
+        this.liveParams = false;
+        this.backendStale = true;
+    }
+
+    // Publish the model data returned by the worker where the rest of the app reads it
+    publishResults(result) {
+        if (result.jsonData !== null && result.jsonData !== undefined) {
+            window.jsonData = result.jsonData;
+        }
+        window.partsData = result.partsData;
+        window.sceneGlb = result.sceneGlb;
+    }
+
+    async runCode(code, options = {}) {
         if (!this.isInitialized) {
             throw new Error('Python environment is not ready yet');
         }
@@ -53,93 +364,306 @@ export class PythonRuntime {
         // Clear previous model data
         window.stlData = null;
         window.partsData = null;
-        
+        window.sceneGlb = null;
+
+        const quality = options.quality || 'fine';
+        this.lastCode = code;
+        this.lastCustomData = options.customData ?? null;
+        const params = this.liveParams && options.changes
+            ? JSON.stringify(options.changes)
+            : this.lastCustomData;
+
+        const start = performance.now();
+        const key = await this.artifactKey('build', { quality, format: this.exportOptions.format });
+        const stored = await this.artifacts.get(key);
+        if (stored) {
+            this.publishResults(stored);
+            // the backend did not run this build: it gets the full parameters next time
+            this.liveParams = false;
+            this.backendStale = true;
+            this.displayOutput('=== MODEL GENERATION OUTPUT ===', '♻️ Loaded from the artifact cache');
+            return {
+                generationOutput: stored.generationOutput,
+                exportOutput: stored.exportOutput,
+                perf: { phases: [{ phase: 'artifact cache', ms: Math.round((performance.now() - start) * 100) / 100 }], parts: [] }
+            };
+        }
+
         try {
-            this.statusManager.updateStatus('🔄 Starting model generation... (this may take 10-30 seconds)', 'Generating model... (this may take 10-30 seconds) ⏳', 'text-sm status-pulse');
-            
-            // Run the generate script
-            const generationOutput = await this.pyodide.runPythonAsync(`
-import sys
-from io import StringIO
-
-old_stdout = sys.stdout
-sys.stdout = buffer = StringIO()
-
-try:
-    print("Executing parametric model...")
-${code.split('\n').map(line => '    ' + line).join('\n')}
-    print("✅ Model generation complete")
-except Exception as e:
-    print(f"❌ Error in model generation: {str(e)}")
-    import traceback
-    traceback.print_exc()
-    raise e
-finally:
-    sys.stdout = old_stdout
-
-buffer.getvalue()
-            `);
-
-            
-            
-            // Display generation output
-            if (generationOutput) {
-                this.statusManager.consoleManager.appendToConsole('=== MODEL GENERATION OUTPUT ===');
-                generationOutput.split('\n').forEach(line => {
-                    if (line.trim()) {
-                        this.statusManager.consoleManager.appendToPythonConsole(line.trim());
-                    }
-                });
-            }
-            
-            this.statusManager.updateStatus('🔄 Starting export process - generating STL, STEP, and BREP files...', 'Exporting STL, STEP, and BREP files... 📦');
-            
-            // Run the export script
-            const exportResponse = await fetch('export.py');
-            const exportScript = await exportResponse.text();
-            
-            const exportOutput = await this.pyodide.runPythonAsync(`
-import sys
-from io import StringIO
-
-old_stdout = sys.stdout
-sys.stdout = buffer = StringIO()
-
-try:
-${exportScript.split('\n').map(line => '    ' + line).join('\n')}
-except Exception as e:
-    print(f"❌ Error in export: {str(e)}")
-    import traceback
-    traceback.print_exc()
-    raise e
-finally:
-    sys.stdout = old_stdout
-
-buffer.getvalue()
-            `);
-            
-            // Display export output
-            if (exportOutput) {
-                this.statusManager.consoleManager.appendToConsole('=== EXPORT PROCESS OUTPUT ===');
-                exportOutput.split('\n').forEach(line => {
-                    if (line.trim()) {
-                        this.statusManager.consoleManager.appendToPythonConsole(line.trim());
-                    }
-                });
-            }
-            
+            if (this.restartPending && !this.native) {
+                await this.restartWorker();
+            }
+            const result = await this.dispatch('build', {
+                code,
+                params,
+                quality,
+                exportOptions: this.exportOptions
+            }, {
+                customData: this.lastCustomData,
+                quality,
+                format: this.exportOptions.format
+            }, options.signal);
+            this.publishResults(result);
+            this.trackMemory(result.memory);
+            this.liveParams = !this.native;
+            this.backendStale = false;
+            this.storeArtifact(key, result);
+
             return {
-                generationOutput,
-                exportOutput
+                generationOutput: result.generationOutput,
+                exportOutput: result.exportOutput,
+                perf: result.perf,
+                memory: result.memory
             };
-            
+
         } catch (error) {
+            this.liveParams = false;
+            if (error instanceof BuildCancelledError) {
+                // stopped part way: the worker's model and parameters are not the displayed ones
+                this.backendStale = true;
+                throw error;
+            }
             this.statusManager.updateStatus(`❌ Runtime Error: ${error.message} - Generation failed`, 'Generation failed ❌', 'text-sm status-error');
             throw error;
         }
     }
 
+    // Build after delay ms without a newer request; resolves like runCode, or rejects with
+    // BuildCancelledError when a newer request supersedes this one
+    scheduleBuild(code, options = {}, delay = 0) {
+        return new Promise((resolve, reject) => {
+            if (this.scheduled) {
+                // the replaced request's parameter changes go with this one (null: full JSON)
+                const previous = this.scheduled;
+                const changes = previous.options.changes && options.changes
+                    ? { ...options.changes, changes: { ...previous.options.changes.changes, ...options.changes.changes } }
+                    : null;
+                options = { ...options, changes };
+                previous.reject(new BuildCancelledError());
+            }
+            this.scheduled = { code, options, resolve, reject };
+            if (this.running) {
+                this.interruptBuild();
+            }
+
+            clearTimeout(this.debounceTimer);
+            this.debounceTimer = setTimeout(() => {
+                this.debounceTimer = null;
+                this.startScheduled();
+            }, delay);
+        });
+    }
+
+    // Stop the running build: it is stale
+    interruptBuild() {
+        const running = this.running;
+        if (running.superseded) return;
+        running.superseded = true;
+        running.controller.abort();
+        // only while the worker runs this very request: anything else it runs must finish
+        if (this.interruptBuffer && !this.native && this.inWorker === running.controller.signal) {
+            Atomics.store(this.interruptBuffer, 0, 2); // SIGINT
+        }
+    }
+
+    async startScheduled() {
+        if (this.running || this.debounceTimer || !this.scheduled) return;
+
+        const { code, options, resolve, reject } = this.scheduled;
+        this.scheduled = null;
+        const running = this.running = { superseded: false, controller: new AbortController() };
+        try {
+            const result = await this.runCode(code, { ...options, signal: running.controller.signal });
+            // it finished before the interrupt took effect, but a newer request is waiting
+            if (running.superseded) throw new BuildCancelledError();
+            resolve(result);
+        } catch (error) {
+            reject(running.superseded ? new BuildCancelledError() : error);
+        } finally {
+            this.running = null;
+            this.startScheduled();
+        }
+    }
+
+    // Build values of a parameter the user can step to next into the worker's build cache.
+    // Runs only while the worker is idle and holds the displayed model; any build request
+    // interrupts it. Resolves with the values built (none if it did not run).
+    async prefetch(name, values) {
+        if (this.native || !this.isInitialized || !this.liveParams || this.backendStale
+            || this.restartPending || this.isBuilding() || values.length === 0) {
+            return [];
+        }
+
+        const running = this.running = { superseded: false, controller: new AbortController() };
+        try {
+            const result = await this.request('prefetch', {
+                name,
+                values,
+                quality: 'coarse',
+                exportOptions: this.exportOptions,
+                seconds: this.prefetchSeconds
+            }, running.controller.signal);
+            this.trackMemory(result.memory);
+            return result.built;
+        } catch (error) {
+            if (!(error instanceof BuildCancelledError)) {
+                console.warn('Prefetch failed:', error.message);
+            }
+            return [];
+        } finally {
+            if (this.running === running) {
+                this.running = null;
+            }
+            this.startScheduled();
+        }
+    }
+
+    // Is a build running or waiting?
+    isBuilding() {
+        return this.running !== null || this.scheduled !== null;
+    }
+
+    // Content hash of the last build's scripts and parameter values, plus kind and options
+    artifactKey(kind, options) {
+        return this.artifacts.key(this.lastCode, this.exportSource, parameterValues(this.lastCustomData), kind, options);
+    }
+
+    // Keep what the viewer needs of a build (not awaited: the store is only a cache)
+    storeArtifact(key, result) {
+        this.artifacts.put(key, {
+            jsonData: result.jsonData ?? window.jsonData ?? null,
+            partsData: result.partsData,
+            sceneGlb: result.sceneGlb,
+            generationOutput: result.generationOutput,
+            exportOutput: result.exportOutput
+        });
+    }
+
+    // The worker does not hold a model that came from the artifact store: build it there first
+    async syncBackend() {
+        if (!this.backendStale || this.native) return;
+        const result = await this.request('build', { code: this.lastCode, params: this.lastCustomData, quality: 'fine', exportOptions: this.exportOptions });
+        this.trackMemory(result.memory);
+        this.backendStale = false;
+        this.liveParams = true;
+    }
+
+    // Re-tessellate the last build at full quality without running generate.py again
+    async refine() {
+        if (!this.isInitialized) {
+            throw new Error('Python environment is not ready yet');
+        }
+
+        try {
+            const start = performance.now();
+            const key = await this.artifactKey('build', { quality: 'fine', format: this.exportOptions.format });
+            const stored = await this.artifacts.get(key);
+            if (stored) {
+                this.publishResults(stored);
+                return {
+                    exportOutput: stored.exportOutput,
+                    perf: { phases: [{ phase: 'artifact cache', ms: Math.round((performance.now() - start) * 100) / 100 }], parts: [] }
+                };
+            }
+
+            await this.syncBackend();
+            const result = await this.dispatch('refine', {
+                quality: 'fine',
+                exportOptions: this.exportOptions
+            }, {
+                customData: this.lastCustomData,
+                quality: 'fine',
+                format: this.exportOptions.format
+            });
+            this.publishResults(result);
+            this.trackMemory(result.memory);
+            this.storeArtifact(key, result);
+            return { exportOutput: result.exportOutput, perf: result.perf, memory: result.memory };
+        } catch (error) {
+            this.statusManager.updateStatus(`❌ Refine Error: ${error.message}`, 'Refine failed ❌', 'text-sm status-error');
+            throw error;
+        }
+    }
+
+    // Export every part of the last build to a download format (STL/STEP/BREP are only generated here)
+    async exportFormat(format) {
+        if (!this.isInitialized) {
+            throw new Error('Python environment is not ready yet');
+        }
+
+        try {
+            this.statusManager.updateStatus(`🔄 Exporting ${format.toUpperCase()} files...`, `Exporting ${format.toUpperCase()}... 📦`, 'text-sm status-pulse');
+            const record = this.perfMetrics && this.perfMetrics.start('export', { backend: this.backend(), format });
+            const key = await this.artifactKey('export', { format });
+            const stored = await this.artifacts.get(key);
+            if (stored) {
+                if (record) {
+                    record.cached = true;
+                    this.perfMetrics.finish(record);
+                }
+                this.statusManager.updateStatus(`✅ ${format.toUpperCase()} export complete`, `${format.toUpperCase()} ready ✅`, 'text-sm status-success');
+                return stored.parts;
+            }
+
+            await this.syncBackend();
+            const result = await this.dispatch('export-format', { format }, {
+                customData: this.lastCustomData,
+                formats: [format],
+                preview: false
+            });
+            // Native responses carry the exported buffers; wrap them as the worker does
+            const parts = result.exports
+                ? result.exports.map(part => ({
+                    name: part.name,
+                    [format]: new Blob([part.data], { type: 'application/octet-stream' })
+                }))
+                : result.parts;
+            this.artifacts.put(key, { parts });
+            this.trackMemory(result.memory);
+            if (record) {
+                record.memory = result.memory;
+                this.perfMetrics.addReport(record, result.perf);
+                this.perfMetrics.finish(record);
+            }
+            this.statusManager.updateStatus(`✅ ${format.toUpperCase()} export complete`, `${format.toUpperCase()} ready ✅`, 'text-sm status-success');
+            return parts;
+        } catch (error) {
+            this.statusManager.updateStatus(`❌ Export Error: ${error.message}`, 'Export failed ❌', 'text-sm status-error');
+            throw error;
+        }
+    }
+
+    // Save micropip.freeze() of the worker as pyodide-lock.json (page opened with ?freeze)
+    async downloadLock() {
+        const lock = await this.request('freeze');
+        const link = document.createElement('a');
+        link.href = URL.createObjectURL(new Blob([lock], { type: 'application/json' }));
+        link.download = 'pyodide-lock.json';
+        link.click();
+        URL.revokeObjectURL(link.href);
+    }
+
+    // Drop every request still queued in the worker
+    async cancel() {
+        if (this.native) return { cancelled: 0 };
+        return this.request('cancel');
+    }
+
+    // Worker state, WASM heap size and build cache counters (or the native pool counters)
+    async stats() {
+        if (this.native) {
+            const response = await fetch(NATIVE_BUILD_URL, { cache: 'no-store' });
+            return response.json();
+        }
+        return this.request('stats');
+    }
+
+    // Where builds currently run, for metrics
+    backend() {
+        return this.native ? 'native' : 'pyodide';
+    }
+
     isReady() {
         return this.isInitialized;
     }
-} 
\ No newline at end of file
+}
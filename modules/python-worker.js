@@ -0,0 +1,423 @@
+// Web Worker hosting Pyodide, setup.py, generate.py and export.py off the UI thread.
+//
+// Protocol (see PythonRuntime for the client side):
+//   request  { id, type, payload }   type: 'init' | 'build' | 'refine' | 'export-format' | 'prefetch' | 'reload-export' | 'freeze' | 'cancel' | 'stats'
+//   response { id, ok: true, result } or { id, ok: false, error }
+//   event    { type: 'status', fullMessage, shortMessage, statusClass }
+//            { type: 'output', heading, output }
+// Requests that run Python are processed one at a time, in order. 'cancel' and
+// 'stats' are answered immediately; 'cancel' drops every queued request.
+// With the interrupt buffer passed to 'init' (a SharedArrayBuffer, available when the
+// page is cross-origin isolated), PythonRuntime stops a running build by storing 2
+// (SIGINT) in it: Python raises KeyboardInterrupt at its next bytecode, and the request
+// fails with { cancelled: true }.
+import { loadPyodide } from 'https://cdn.jsdelivr.net/pyodide/v0.28.0a3/full/pyodide.mjs';
+
+// The Python scripts publish their results on js.window (window.jsonData, window.partsData, ...)
+self.window = self;
+
+const ROOT_URL = new URL('../', import.meta.url);
+const SETUP_URL = new URL('../setup.py', import.meta.url);
+const EXPORT_URL = new URL('../export.py', import.meta.url);
+
+let pyodide = null;
+let queue = [];
+let running = false;
+
+// Time and WASM heap growth of each startup step, in order
+const startupProfile = [];
+
+function updateStatus(fullMessage, shortMessage, statusClass = 'text-sm') {
+    self.postMessage({ type: 'status', fullMessage, shortMessage, statusClass });
+}
+
+function postOutput(heading, output) {
+    if (output) {
+        self.postMessage({ type: 'output', heading, output });
+    }
+}
+
+function heapBytes() {
+    return pyodide ? pyodide._module.HEAP8.length : 0;
+}
+
+// The WASM heap grows but never shrinks. Above RELEASE_AT of the ceiling (set by init), the
+// Python caches are dropped so freed memory is reused instead of growing the heap further;
+// at the ceiling PythonRuntime replaces the worker before the tab runs out of memory.
+const RELEASE_AT = 0.75;
+let memoryCeiling = 0;
+let releasedAt = 0;
+
+function checkMemory() {
+    let heap = heapBytes();
+    let released = false;
+    // release once per growth step: while the heap stays the same size, the caches fit in it
+    if (memoryCeiling && heap > memoryCeiling * RELEASE_AT && heap > releasedAt && pyodide.globals.has('model_session')) {
+        pyodide.runPython('model_session.release()');
+        releasedAt = heap = heapBytes();
+        released = true;
+    }
+    return { heapBytes: heap, ceilingBytes: memoryCeiling, released, restart: memoryCeiling > 0 && heap >= memoryCeiling };
+}
+
+async function profileStep(step, fn) {
+    const start = performance.now();
+    const heap = heapBytes();
+    const result = await fn();
+    startupProfile.push({ step, ms: Math.round(performance.now() - start), heapBytes: heapBytes() - heap });
+    return result;
+}
+
+// Load the Pyodide packages a script imports (a no-op once they are loaded)
+async function loadImports(script, label) {
+    const before = new Set(Object.keys(pyodide.loadedPackages));
+    const start = performance.now();
+    const heap = heapBytes();
+    await pyodide.loadPackagesFromImports(script);
+
+    const added = Object.keys(pyodide.loadedPackages).filter(name => !before.has(name));
+    if (added.length > 0) {
+        startupProfile.push({
+            step: `${label} imports: ${added.join(', ')}`,
+            ms: Math.round(performance.now() - start),
+            heapBytes: heapBytes() - heap
+        });
+    }
+}
+
+// Phase timings recorded by the Python scripts (utils.PhaseTimer), plus the script totals measured here
+function resetPerf() {
+    if (pyodide.globals.has('perf')) {
+        pyodide.runPython('perf.reset()');
+    }
+}
+
+function perfReport(phases = []) {
+    if (!pyodide.globals.has('perf')) {
+        return { phases, parts: [] };
+    }
+    const report = pyodide.runPython('perf.report()');
+    const result = report.toJs({ dict_converter: Object.fromEntries });
+    report.destroy();
+    result.phases.push(...phases);
+    return result;
+}
+
+async function timed(phase, phases, fn) {
+    const start = performance.now();
+    try {
+        return await fn();
+    } finally {
+        phases.push({ phase, ms: Math.round((performance.now() - start) * 100) / 100 });
+    }
+}
+
+// A build stopped through the interrupt buffer
+function interrupted(error) {
+    return error.type === 'KeyboardInterrupt';
+}
+
+// Run a script as is (no wrapping or re-indenting) with stdout captured, returning what it printed
+async function runCaptured(script, errorLabel, { filename, before, after } = {}) {
+    const lines = before ? [before] : [];
+    pyodide.setStdout({ batched: line => lines.push(line) });
+    try {
+        await pyodide.runPythonAsync(script, { filename });
+        if (after) lines.push(after);
+    } catch (error) {
+        lines.push(`❌ Error in ${errorLabel}: ${error.message}`);
+        throw Object.assign(error, { output: lines.join('\n') });
+    } finally {
+        pyodide.setStdout();
+    }
+    return lines.join('\n');
+}
+
+// export.py as PythonRuntime loaded it (the same text its artifact keys hash); replaced by
+// 'reload-export' when the page is told the file changed
+let exportScript = '';
+let exportImportsLoaded = false;
+
+let interruptBuffer = null;
+
+async function init({ memoryCeiling: ceiling = 0, interruptBuffer: buffer = null, exportSource = '' } = {}) {
+    memoryCeiling = ceiling;
+    interruptBuffer = buffer;
+    exportScript = exportSource || await (await fetch(EXPORT_URL)).text();
+    updateStatus('🔄 Loading Python WebAssembly runtime...', 'Loading Python WebAssembly runtime...', 'text-sm status-pulse');
+    pyodide = await profileStep('loadPyodide', () => loadPyodide());
+    if (interruptBuffer) {
+        pyodide.setInterruptBuffer(interruptBuffer);
+    }
+
+    // Only micropip up front; setup.py installs build123d (and its dependencies), and the
+    // packages the model scripts import are loaded before they run
+    updateStatus('📦 Installing micropip...', 'Installing micropip...');
+    await profileStep('loadPackage micropip', () => pyodide.loadPackage('micropip'));
+
+    // Run the setup script (installs build123d and other packages)
+    updateStatus('⚙️ Setting up Python environment and packages...', 'Setting up Python environment and packages...');
+    const response = await fetch(SETUP_URL);
+    const setupScript = await response.text();
+    pyodide.globals.set('ROOT_URL', ROOT_URL.href);
+    await profileStep('setup.py', () => pyodide.runPythonAsync(setupScript));
+
+    // setup.py's own steps, listed after it
+    const setupProfile = pyodide.globals.get('startup_profile');
+    startupProfile.push(...setupProfile.toJs({ dict_converter: Object.fromEntries }).map(
+        entry => ({ ...entry, step: `setup.py: ${entry.step}` })
+    ));
+    setupProfile.destroy();
+
+    updateStatus('✅ Python packages installed successfully!', 'Python packages installed successfully!');
+
+    return { ready: true, startupProfile };
+}
+
+async function runExport(exportOptions, quality) {
+    updateStatus(`🔄 Starting export process - tessellating ${quality} preview mesh...`, `Tessellating ${quality} preview mesh... 📦`);
+
+    if (!exportImportsLoaded) {
+        await loadImports(exportScript, 'export.py');
+        exportImportsLoaded = true;
+    }
+    const options = pyodide.toPy({ ...exportOptions, quality });
+    pyodide.globals.set('export_options', options);
+    options.destroy();
+
+    const exportOutput = await runCaptured(exportScript, 'export', { filename: 'export.py' }).catch(error => {
+        if (!interrupted(error)) {
+            postOutput('=== EXPORT PROCESS OUTPUT ===', error.output);
+        }
+        throw error;
+    });
+    postOutput('=== EXPORT PROCESS OUTPUT ===', exportOutput);
+    return exportOutput;
+}
+
+// Collect the model data published by the scripts, with the buffers to transfer
+function collectResults(result) {
+    const transfer = new Set();
+    const partsData = self.partsData || null;
+    const sceneGlb = self.sceneGlb || null;
+
+    if (partsData) {
+        partsData.forEach(part => {
+            if (part.mesh) {
+                Object.values(part.mesh).forEach(array => transfer.add(array.buffer));
+            }
+        });
+    }
+    if (sceneGlb) {
+        transfer.add(sceneGlb.buffer);
+    }
+
+    // the buffers are transferred: keep no references to them here
+    self.partsData = null;
+    self.sceneGlb = null;
+
+    return {
+        result: { ...result, jsonData: self.jsonData ?? null, partsData, sceneGlb, memory: checkMemory() },
+        transfer: [...transfer]
+    };
+}
+
+const SESSION_RUN = `p, output = model_session.run(_source, _custom_data)
+if p is not None:
+    window.jsonData = p.dumps()
+`;
+let loadedCode = null;
+
+async function build({ code, params, quality, exportOptions }) {
+    // Clear previous model data
+    self.partsData = null;
+    self.sceneGlb = null;
+    resetPerf();
+    const phases = [];
+
+    // Parameters for generate.py: full JSON, a {v, changes} delta, or null for the defaults.
+    // model_session (setup.py) compiles generate.py only when it changes and otherwise
+    // just calls its params()/build() again in the same namespace.
+    pyodide.globals.set('_source', code);
+    pyodide.globals.set('_custom_data', params ?? null);
+
+    updateStatus('🔄 Starting model generation... (this may take 10-30 seconds)', 'Generating model... (this may take 10-30 seconds) ⏳', 'text-sm status-pulse');
+    if (code !== loadedCode) {
+        await timed('load imports', phases, () => loadImports(code, 'generate.py'));
+        loadedCode = code;
+    }
+    const generationOutput = await timed('generate.py', phases, () => runCaptured(SESSION_RUN, 'model generation', {
+        filename: 'generate.py',
+        before: 'Executing parametric model...',
+        after: '✅ Model generation complete'
+    })).catch(error => {
+        if (!interrupted(error)) {
+            postOutput('=== MODEL GENERATION OUTPUT ===', error.output);
+        }
+        throw error;
+    });
+    postOutput('=== MODEL GENERATION OUTPUT ===', generationOutput);
+
+    const exportOutput = await timed('export.py', phases, () => runExport(exportOptions, quality));
+    return collectResults({ generationOutput, exportOutput, perf: perfReport(phases) });
+}
+
+async function refine({ quality, exportOptions }) {
+    self.partsData = null;
+    self.sceneGlb = null;
+    resetPerf();
+    const phases = [];
+
+    const exportOutput = await timed('export.py', phases, () => runExport(exportOptions, quality));
+    return collectResults({ exportOutput, perf: perfReport(phases) });
+}
+
+// Build the neighbouring values of a parameter into build_cache with their preview meshes
+// (tessellated by the functions export.py defined), so stepping to one is a cache hit
+const PREFETCH_RUN = `_mesh = local_mesh if _prefetch['format'] == 'glb' else part_mesh
+_prefetched = model_session.prefetch(_prefetch['name'], _prefetch['values'],
+    lambda output: [_mesh(part_info, _prefetch['quality']) for part_info in output], _prefetch['seconds'])
+`;
+// Prefetched builds are optional: none once the heap is past this share of the ceiling
+const PREFETCH_AT = 0.5;
+
+async function prefetch({ name, values, quality = 'coarse', exportOptions = {}, seconds = 2 }) {
+    // the preview mesh functions exist once export.py has run
+    if (!pyodide.globals.has('part_mesh') || (memoryCeiling && heapBytes() > memoryCeiling * PREFETCH_AT)) {
+        return { built: [] };
+    }
+
+    const options = pyodide.toPy({ name, values, quality, format: exportOptions.format || 'mesh', seconds });
+    pyodide.globals.set('_prefetch', options);
+    options.destroy();
+    await runCaptured(PREFETCH_RUN, 'prefetch');
+
+    const prefetched = pyodide.globals.get('_prefetched');
+    try {
+        return { built: prefetched.toJs(), memory: checkMemory() };
+    } finally {
+        prefetched.destroy();
+    }
+}
+
+// Copy a Python buffer straight out of the WASM heap into a Blob, then free the proxy
+function bufferToBlob(proxy) {
+    const buffer = proxy.getBuffer('u8');
+    try {
+        return new Blob([buffer.data], { type: 'application/octet-stream' });
+    } finally {
+        buffer.release();
+        proxy.destroy();
+    }
+}
+
+async function exportFormat({ format }) {
+    const exportFormat = pyodide.globals.get('export_format');
+    if (!exportFormat) {
+        throw new Error('No model has been generated yet');
+    }
+
+    resetPerf();
+    try {
+        const parts = exportFormat(format).map(part => ({
+            name: part.name,
+            [format]: bufferToBlob(part.data)
+        }));
+        return { parts, perf: perfReport(), memory: checkMemory() };
+    } finally {
+        exportFormat.destroy();
+    }
+}
+
+// A new export.py: meshes and exports cached by the old one are dropped with the builds
+function reloadExport({ source }) {
+    exportScript = source;
+    exportImportsLoaded = false;
+    if (pyodide.globals.has('model_session')) {
+        pyodide.runPython('model_session.release()');
+    }
+    return { reloaded: true };
+}
+
+// Lockfile of the installed packages, for wheelhouse.py vendor
+function freeze() {
+    return pyodide.runPython('import micropip\nmicropip.freeze()');
+}
+
+function stats() {
+    const result = {
+        initialized: pyodide !== null,
+        busy: running,
+        queued: queue.length,
+        heapBytes: heapBytes(),
+        memoryCeiling,
+        startupProfile
+    };
+    if (pyodide && pyodide.globals.has('build_cache')) {
+        const cacheStats = pyodide.runPython('build_cache.stats()');
+        result.buildCache = cacheStats.toJs({ dict_converter: Object.fromEntries });
+        cacheStats.destroy();
+    }
+    if (pyodide && pyodide.globals.has('stages')) {
+        const stageStats = pyodide.runPython('stages.stats()');
+        result.stages = stageStats.toJs({ dict_converter: Object.fromEntries });
+        stageStats.destroy();
+    }
+    return result;
+}
+
+const HANDLERS = {
+    'init': init,
+    'build': build,
+    'refine': refine,
+    'export-format': exportFormat,
+    'prefetch': prefetch,
+    'reload-export': reloadExport,
+    'freeze': freeze
+};
+
+function respond(id, value) {
+    if (value && value.transfer) {
+        self.postMessage({ id, ok: true, result: value.result }, value.transfer);
+    } else {
+        self.postMessage({ id, ok: true, result: value });
+    }
+}
+
+async function drainQueue() {
+    if (running) return;
+    running = true;
+
+    while (queue.length > 0) {
+        const { id, type, payload } = queue.shift();
+        // an interrupt still set was meant for the request before this one
+        if (interruptBuffer) {
+            Atomics.store(interruptBuffer, 0, 0);
+        }
+        try {
+            respond(id, await HANDLERS[type](payload || {}));
+        } catch (error) {
+            self.postMessage({ id, ok: false, error: error.message, cancelled: interrupted(error) });
+        }
+    }
+
+    running = false;
+}
+
+self.onmessage = (event) => {
+    const { id, type } = event.data;
+
+    if (type === 'stats') {
+        respond(id, stats());
+    } else if (type === 'cancel') {
+        const dropped = queue;
+        queue = [];
+        dropped.forEach(request => self.postMessage({ id: request.id, ok: false, error: 'Cancelled' }));
+        respond(id, { cancelled: dropped.length });
+    } else if (type in HANDLERS) {
+        queue.push(event.data);
+        drainQueue();
+    } else {
+        self.postMessage({ id, ok: false, error: `Unknown request type '${type}'` });
+    }
+};
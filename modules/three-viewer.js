@@ -1,6 +1,6 @@
 import * as THREE from 'three';
 import { OrbitControls } from 'three/addons/controls/OrbitControls.js';
-import { STLLoader } from 'three/addons/loaders/STLLoader.js';
+import { GLTFLoader } from 'three/addons/loaders/GLTFLoader.js';
 
 export class ThreeViewer {
     constructor(container, placeholder) {
@@ -116,21 +116,31 @@ export class ThreeViewer {
         }
     }
 
-    loadParts(partsData) {
-        const loader = new STLLoader();
-        
-        // Remove existing meshes
-        this.currentMeshes.forEach(mesh => {
-            this.scene.remove(mesh);
+    // Wrap the indexed typed arrays from export.py directly as BufferGeometry attributes
+    createGeometry(mesh) {
+        const geometry = new THREE.BufferGeometry();
+        geometry.setAttribute('position', new THREE.BufferAttribute(mesh.positions, 3));
+        geometry.setAttribute('normal', new THREE.BufferAttribute(mesh.normals, 3));
+        geometry.setIndex(new THREE.BufferAttribute(mesh.index, 1));
+        geometry.computeBoundingSphere();
+        return geometry;
+    }
+
+    // Outline the part's edges (pairs of points, one pair per segment)
+    createEdges(edges, color) {
+        const geometry = new THREE.BufferGeometry();
+        geometry.setAttribute('position', new THREE.BufferAttribute(edges, 3));
+        const material = new THREE.LineBasicMaterial({
+            color: new THREE.Color(color).multiplyScalar(0.5)
         });
-        this.currentMeshes = [];
+        return new THREE.LineSegments(geometry, material);
+    }
 
+    loadParts(partsData, fitCamera = true) {
         const allMeshes = [];
         
         partsData.forEach((partData, index) => {
-            // Parse STL data
-            const stlData = new Uint8Array(partData.stl);
-            const geometry = loader.parse(stlData.buffer);
+            const geometry = this.createGeometry(partData.mesh);
             
             // Create material with part-specific color and opacity
             const color = partData.color ? partData.color : this.getDefaultColor(index);
@@ -150,12 +160,79 @@ export class ThreeViewer {
             mesh.receiveShadow = true;
             mesh.name = partData.name || `part_${index}`;
             
+            if (partData.mesh.edges && partData.mesh.edges.length > 0) {
+                mesh.add(this.createEdges(partData.mesh.edges, color));
+            }
+            
             // Set render order for transparent objects (higher numbers render later)
             if (material.transparent) {
                 mesh.renderOrder = 1;
             }
             
             allMeshes.push(mesh);
+        });
+        
+        this.showMeshes(allMeshes, fitCamera);
+    }
+
+    // Load a binary glTF scene (colours, opacity and instancing come from the file)
+    loadGlb(glbData, fitCamera = true) {
+        const buffer = glbData.buffer.slice(glbData.byteOffset, glbData.byteOffset + glbData.byteLength);
+        
+        return new Promise((resolve, reject) => {
+            new GLTFLoader().parse(buffer, '', (gltf) => {
+                const allMeshes = [...gltf.scene.children];
+                allMeshes.forEach(object => {
+                    object.traverse(child => {
+                        if (child.isMesh) {
+                            child.castShadow = true;
+                            child.receiveShadow = true;
+                            if (child.material.transparent) {
+                                child.renderOrder = 1;
+                            }
+                        }
+                    });
+                });
+                
+                this.showMeshes(allMeshes, fitCamera);
+                resolve();
+            }, reject);
+        });
+    }
+
+    // Free the GPU buffers and textures of a removed object (three.js keeps them until disposed)
+    disposeObject(object) {
+        object.traverse(child => {
+            if (child.geometry) {
+                child.geometry.dispose();
+            }
+            const materials = Array.isArray(child.material) ? child.material : (child.material ? [child.material] : []);
+            materials.forEach(material => {
+                Object.values(material).forEach(value => {
+                    if (value && value.isTexture) {
+                        value.dispose();
+                    }
+                });
+                material.dispose();
+            });
+        });
+    }
+
+    // GPU resources currently allocated by the renderer
+    memoryInfo() {
+        return this.renderer ? { ...this.renderer.info.memory } : null;
+    }
+
+    // Replace the displayed meshes, centre them as a group and (optionally) fit the camera
+    showMeshes(allMeshes, fitCamera = true) {
+        // Remove and free existing meshes
+        this.currentMeshes.forEach(mesh => {
+            this.scene.remove(mesh);
+            this.disposeObject(mesh);
+        });
+        this.currentMeshes = [];
+
+        allMeshes.forEach(mesh => {
             this.currentMeshes.push(mesh);
             this.scene.add(mesh);
         });
@@ -195,7 +272,9 @@ export class ThreeViewer {
         this.renderer.domElement.style.display = 'block';
         
         // Fit camera to model
-        this.resetCameraView();
+        if (fitCamera) {
+            this.resetCameraView();
+        }
     }
 
     getDefaultColor(index) {
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Native (CPython + OCCT) builds for the /build endpoint of server.py.
+
+A build runs generate.py with the posted _custom_data, then the export.py
+functions, in a worker process of server.py's pool. The result is returned
+as one binary frame so mesh buffers reach the browser without JSON encoding:
+
+    [uint32 header length][JSON header][padding][buffer][padding][buffer]...
+
+Arrays in the header are replaced by {"buffer": i, "dtype": ...} references;
+header["buffers"] lists the [offset, length] of each buffer in the frame.
+Every buffer starts on an 8 byte boundary so it can be viewed as a typed array.
+"""
+
+import hashlib
+import importlib
+import json
+import os
+import runpy
+import struct
+import sys
+import time
+import traceback
+from contextlib import redirect_stdout
+from io import StringIO
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+GENERATE_PATH = os.path.join(ROOT, 'generate.py')
+
+ALIGN = 8
+
+
+class NativeBuildError(Exception):
+    """The model script or an export failed; carries what the build printed."""
+
+    def __init__(self, message, output=''):
+        super().__init__(message, output)
+        self.message = message
+        self.output = output
+
+    def __str__(self):
+        return self.message
+
+
+def warm_up():
+    """Pool initializer: import build123d/OCCT once per worker process."""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import build123d  # noqa: F401
+    import export  # noqa: F401
+
+
+_session = None
+_export_digest = None
+
+
+def model_session():
+    """This process's ModelSession: generate.py stays compiled between builds.
+
+    The pool's processes serve every client, so requests carry the full parameter
+    JSON (see check_request) and never depend on what the process built last.
+    """
+    global _session
+    if _session is None:
+        from utils import ModelSession
+        _session = ModelSession(GENERATE_PATH, {'__name__': '__generate__', '__file__': GENERATE_PATH})
+    return _session
+
+
+def export_module():
+    """export.py, imported again when the file changed since this process last used it.
+
+    server.py keys stored results on the file's content, so a process must not keep
+    running the version it imported at startup. The meshes and exports the old version
+    cached on the session's builds are dropped with them.
+    """
+    global _export_digest
+    import export
+    with open(export.__file__, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    if _export_digest is not None and digest != _export_digest:
+        export = importlib.reload(export)
+        model_session().release()
+    _export_digest = digest
+    return export
+
+
+def check_request(request):
+    """Reject what a native build cannot answer correctly: customData must be the full
+    parameter JSON (or null for the defaults), not a {v, changes} delta to some earlier build."""
+    custom_data = request.get('customData')
+    if custom_data is None:
+        return
+    try:
+        data = json.loads(custom_data) if isinstance(custom_data, str) else custom_data
+    except ValueError:
+        raise ValueError('customData is not valid JSON') from None
+    if not isinstance(data, dict) or 'children' not in data:
+        raise ValueError('customData must be the full parameter JSON; parameter deltas are not accepted')
+
+
+def load_index():
+    """generate.py's index of parameter lists by shape, and the ParameterGroup class it uses."""
+    warm_up()
+    with redirect_stdout(StringIO()):
+        namespace = runpy.run_path(GENERATE_PATH)
+    return namespace['index'], namespace['ParameterGroup']
+
+
+def read_generate():
+    with open(GENERATE_PATH, encoding='utf-8') as f:
+        return f.read()
+
+
+def pack(header, buffers):
+    """Serialise the header and buffers into one frame."""
+    offsets = []
+    position = 0
+    header = dict(header, buffers=offsets)
+
+    # Offsets depend on the header length, which depends on the offsets: iterate until stable
+    while True:
+        encoded = json.dumps(header, separators=(',', ':')).encode()
+        position = -(-(4 + len(encoded)) // ALIGN) * ALIGN
+        layout = []
+        for buffer in buffers:
+            layout.append([position, len(buffer)])
+            position = -(-(position + len(buffer)) // ALIGN) * ALIGN
+        if layout == offsets:
+            break
+        offsets[:] = layout
+
+    frame = bytearray(position)
+    frame[0:4] = struct.pack('<I', len(encoded))
+    frame[4:4 + len(encoded)] = encoded
+    for (offset, length), buffer in zip(offsets, buffers):
+        frame[offset:offset + length] = buffer
+    return bytes(frame)
+
+
+def read_header(frame):
+    """The JSON header of a response frame."""
+    header_length = struct.unpack_from('<I', frame)[0]
+    return json.loads(frame[4:4 + header_length])
+
+
+def extract_buffers(value, buffers):
+    """Replace arrays and bytes in value by buffer references, collecting the buffers."""
+    if isinstance(value, np.ndarray):
+        buffers.append(np.ascontiguousarray(value).tobytes())
+        return {'buffer': len(buffers) - 1, 'dtype': value.dtype.name}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        buffers.append(bytes(value))
+        return {'buffer': len(buffers) - 1, 'dtype': 'uint8'}
+    if isinstance(value, dict):
+        return {key: extract_buffers(item, buffers) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [extract_buffers(item, buffers) for item in value]
+    return value
+
+
+def build(request, source=None):
+    """Run one build request and return the response frame.
+
+    request: {customData, quality, format, formats, preview}, as posted by PythonRuntime.
+    """
+    warm_up()
+    export = export_module()
+    from utils import perf
+
+    check_request(request)
+    if source is None:
+        source = read_generate()
+    fmt = request.get('format', 'mesh')
+    quality = request.get('quality', 'fine')
+    formats = request.get('formats') or []
+    for name in formats:
+        if name not in export.EXPORTERS:
+            raise NativeBuildError(f"Unknown export format '{name}'. Expected one of: {list(export.EXPORTERS)}")
+
+    perf.reset()
+    session = model_session()
+    generation = StringIO()
+    start = time.perf_counter()
+    try:
+        with redirect_stdout(generation):
+            print("Executing parametric model...")
+            p, output = session.run(source, request.get('customData'))
+            print("✅ Model generation complete")
+    except Exception as e:
+        generation.write(f"❌ Error in model generation: {e}\n{traceback.format_exc()}")
+        raise NativeBuildError(str(e) or type(e).__name__, generation.getvalue()) from None
+
+    generate_ms = (time.perf_counter() - start) * 1000
+    exporting = StringIO()
+    start = time.perf_counter()
+    try:
+        with redirect_stdout(exporting):
+            output = export.validate_output(output)
+            parts_data, scene_glb = [], None
+            if request.get('preview', True):
+                parts_data, scene_glb = export.preview(output, {'format': fmt, 'quality': quality})
+
+            exports = []
+            for name in formats:
+                print(f"Exporting {name.upper()} for {len(output)} part(s)...")
+                for part_info in output:
+                    exports.append({'name': part_info['name'], 'format': name, 'data': export.export_part(part_info, name)})
+    except Exception as e:
+        exporting.write(f"❌ Error in export: {e}\n{traceback.format_exc()}")
+        raise NativeBuildError(str(e) or type(e).__name__, generation.getvalue() + exporting.getvalue()) from None
+
+    export_ms = (time.perf_counter() - start) * 1000
+    report = perf.report()
+    report['phases'] += [{'phase': 'generate.py', 'ms': round(generate_ms, 2)}, {'phase': 'export.py', 'ms': round(export_ms, 2)}]
+
+    cache = session.namespace.get('build_cache')
+    if cache is not None:
+        cache.trim()
+
+    buffers = []
+    header = {
+        'generationOutput': generation.getvalue(),
+        'exportOutput': exporting.getvalue(),
+        'jsonData': p.dumps() if p is not None else None,
+        'partsData': extract_buffers(parts_data, buffers),
+        'sceneGlb': extract_buffers(scene_glb, buffers) if scene_glb is not None else None,
+        'exports': extract_buffers(exports, buffers),
+        'perf': report,
+    }
+    return pack(header, buffers)
+
+
+if __name__ == '__main__':
+    # Run a build from the command line: python native.py [custom_data.json] > frame.bin
+    custom_data = None
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding='utf-8') as f:
+            custom_data = f.read()
+    frame = build({'customData': custom_data})
+    header = read_header(frame)
+    print(header['generationOutput'] + header['exportOutput'], file=sys.stderr)
+    print(f"{len(frame)} bytes, {len(header['buffers'])} buffer(s)", file=sys.stderr)
+    if not sys.stdout.isatty():
+        sys.stdout.buffer.write(frame)
@@ -2,10 +2,12 @@
 import { ThreeViewer } from './modules/three-viewer.js';
 import { ConsoleManager } from './modules/console-manager.js';
 import { StatusManager } from './modules/status-manager.js';
-import { PythonRuntime } from './modules/python-runtime.js';
+import { PythonRuntime, BuildCancelledError } from './modules/python-runtime.js';
 import { ParameterHandler } from './modules/parameter-handler.js';
 import { FileDownloads } from './modules/file-downloads.js';
 import { UIControls } from './modules/ui-controls.js';
+import { PerfMetrics } from './modules/perf-metrics.js';
+import { HotReload } from './modules/hot-reload.js';
 
 // Main Application Class
 class WebAssmPyApp {
@@ -23,6 +25,8 @@ class WebAssmPyApp {
         this.parameterHandler = new ParameterHandler(this.statusManager);
         this.fileDownloads = new FileDownloads();
         this.uiControls = new UIControls();
+        this.perfMetrics = new PerfMetrics();
+        this.hotReload = new HotReload();
         
         // Initialize Three.js viewer
         const threeContainer = document.getElementById('three-container');
@@ -31,7 +35,25 @@ class WebAssmPyApp {
         
         // Cross-wire dependencies
         this.fileDownloads.parameterHandler = this.parameterHandler;
+        this.fileDownloads.pythonRuntime = this.pythonRuntime;
+        this.pythonRuntime.perfMetrics = this.perfMetrics;
         this.parameterHandler.onGenerationTrigger = () => this.runPythonCode();
+        this.parameterHandler.onParameterInput = () => this.onParameterInput();
+        this.hotReload.onChange = (file) => this.onScriptChange(file);
+        
+        // Live preview: coarse builds while parameters change, refined once input settles.
+        // PythonRuntime.scheduleBuild() debounces them and runs only the latest, interrupting
+        // a build that a newer change made stale.
+        this.liveDelay = 80; // ms without input before a live build starts
+        this.refineDelay = 600; // ms without input before the coarse preview is refined
+        this.refineTimer = null;
+        this.isRefining = false;
+        this.buildSerial = 0; // counts build requests, so a refine that a build overtook is dropped
+
+        // Idle prefetch: once the preview is refined, the steps around the last touched number
+        // are built ahead in the worker, so the next notch of a slider is usually ready
+        this.prefetchDelay = 300; // ms after the refined preview before prefetching
+        this.prefetchTimer = null;
         
         // DOM elements
         this.runButton = document.getElementById('run-code');
@@ -70,6 +92,9 @@ class WebAssmPyApp {
             this.runPythonCode();
             await this.parameterHandler.loadParameterDefinitionsEarly();
             
+            // Rebuild when server.py reports an edit of generate.py
+            this.hotReload.start();
+            
         } catch (error) {
             console.error('Failed to initialize application:', error);
             this.statusManager.updateStatus('❌ Failed to initialize application: ' + error.message, 'Initialization Failed ❌', 'text-sm status-error');
@@ -77,7 +102,115 @@ class WebAssmPyApp {
         }
     }
 
-    async runPythonCode() {
+    // A watched script changed on the server: reload generate.py or export.py and rebuild with the current values
+    async onScriptChange(file) {
+        if (!this.isInitialized) return;
+
+        if (file !== 'generate.py' && file !== 'export.py') {
+            this.statusManager.updateStatus(`🔁 ${file} changed on the server, reload the page to use it`, `${file} changed, reload the page 🔁`, 'text-sm status-pulse');
+            return;
+        }
+
+        try {
+            if (file === 'generate.py') {
+                await this.parameterHandler.refetchAndParseScript();
+            } else {
+                await this.pythonRuntime.reloadExport();
+            }
+        } catch (error) {
+            this.consoleManager.appendToConsole(`Hot reload Error: ${error.message}`);
+            return;
+        }
+        this.consoleManager.appendToConsole(`🔁 ${file} changed, rebuilding...`);
+        this.runPythonCode({ reload: true });
+    }
+
+    // Rebuild with a coarse tessellation on every parameter change
+    onParameterInput() {
+        if (!this.isInitialized) return;
+        
+        clearTimeout(this.refineTimer);
+        this.runPythonCode({ quality: 'coarse', live: true });
+    }
+
+    // Re-tessellate the last build at full quality once input has settled
+    scheduleRefine() {
+        clearTimeout(this.refineTimer);
+        this.refineTimer = setTimeout(() => this.refinePreview(), this.refineDelay);
+    }
+
+    async refinePreview() {
+        if (this.isRefining || this.pythonRuntime.isBuilding()) return;
+        
+        this.isRefining = true;
+        const serial = this.buildSerial;
+        const record = this.perfMetrics.start('refine', { backend: this.pythonRuntime.backend(), quality: 'fine' });
+        try {
+            const run = await this.perfMetrics.measure(record, 'python', () => this.pythonRuntime.refine());
+            this.perfMetrics.addReport(record, run.perf);
+            if (serial !== this.buildSerial) {
+                // parameters changed meanwhile: this is the old model
+                record.superseded = true;
+                return;
+            }
+            await this.perfMetrics.measure(record, 'viewer', () => this.displayResults(false));
+            record.memory = { ...run.memory, viewer: this.threeViewer.memoryInfo() };
+            this.schedulePrefetch();
+        } catch (error) {
+            record.error = error.message;
+            this.consoleManager.appendToConsole(`Refine Error: ${error.message}`);
+        } finally {
+            this.perfMetrics.finish(record);
+            this.isRefining = false;
+        }
+    }
+
+    schedulePrefetch() {
+        clearTimeout(this.prefetchTimer);
+        this.prefetchTimer = setTimeout(() => {
+            const whenIdle = window.requestIdleCallback || (callback => callback());
+            whenIdle(() => this.prefetchNeighbours());
+        }, this.prefetchDelay);
+    }
+
+    async prefetchNeighbours() {
+        const name = this.parameterHandler.lastTouched;
+        // a hidden tab or unsent input: the next build is not a single step from here
+        if (!name || document.hidden || this.parameterHandler.hasPendingChanges()) return;
+
+        const built = await this.pythonRuntime.prefetch(name, this.parameterHandler.neighbourValues(name));
+        if (built.length > 0) {
+            console.log(`Prefetched ${name} = ${built.join(', ')}`);
+        }
+    }
+
+    // Show the model data produced by export.py
+    async displayResults(fitCamera) {
+        // Check if model data is available (supports both single and multiple parts)
+        if (!window.partsData) {
+            this.consoleManager.appendToConsole('❌ No model data generated');
+            throw new Error('No model data generated');
+        }
+        
+        const partsData = window.partsData;
+        this.fileDownloads.updateCurrentParts(partsData);
+        
+        if (window.sceneGlb) {
+            await this.threeViewer.loadGlb(window.sceneGlb, fitCamera);
+        } else {
+            this.threeViewer.loadParts(partsData, fitCamera);
+        }
+        this.fileDownloads.enableDownloadButtons();
+        this.resetViewButton.disabled = false;
+        
+        this.statusManager.updateStatus(
+            `🎉 Success! Generated ${partsData.length} parts for 3D viewer - Model generated successfully!`, 
+            `Model generated successfully! 🎉 (${partsData.length} parts)`, 
+            'text-sm status-success'
+        );
+    }
+
+    async runPythonCode(options = {}) {
         if (!this.isInitialized) {
             alert('Python environment is not ready yet. Please wait...');
             return;
@@ -88,59 +221,75 @@ class WebAssmPyApp {
             return;
         }
 
+        this.buildSerial++;
+        clearTimeout(this.refineTimer);
+        clearTimeout(this.prefetchTimer);
+        const quality = options.quality || 'fine';
+        const record = this.perfMetrics.start('build', { backend: this.pythonRuntime.backend(), quality });
+
         // Show loading state
         this.runButton.disabled = true;
         this.runText.innerHTML = '<div class="loading-spinner"></div>Generating...';
         this.runText.parentElement.classList.add('loading');
         
         // Close mobile sidebar if open
-        this.uiControls.closeSidebarIfOpen();
+        if (!options.live) {
+            this.uiControls.closeSidebarIfOpen();
+        }
 
         try {
             
             // Get current parameter values
             // const params = this.parameterHandler.getParameterValues();
             
-            // Create parameterized script
-            const code = this.parameterHandler.createParameterizedScript();
+            // generate.py runs unmodified; the parameters go with it (only the changed values when possible)
+            const code = this.parameterHandler.basePythonScript;
+            const changes = this.parameterHandler.takeChanges();
             
-            // Run the Python code
-            await this.pythonRuntime.runCode(code);
+            // Run the Python code: live builds wait for input to pause, and the latest request wins
+            const run = await this.perfMetrics.measure(record, 'python', () =>
+                this.pythonRuntime.scheduleBuild(code, {
+                    quality,
+                    customData: this.parameterHandler.getCustomData(),
+                    // a reloaded script gets the full parameter JSON, not a delta to the old script's group
+                    changes: options.reload ? null : changes
+                }, options.live ? this.liveDelay : 0)
+            );
+            this.perfMetrics.addReport(record, run.perf);
 
             if (window.jsonData){
                 console.log('UPDATING UI')
-                this.parameterHandler.reloadParameterDefinitions()
+                this.parameterHandler.syncParameterDefinitions()
 
             }
             
-            // Check if model data is available (supports both single and multiple parts)
-            if (window.partsData) {
-                const partsData = window.partsData;
-                this.fileDownloads.updateCurrentParts(partsData);
-                
-                this.threeViewer.loadParts(partsData);
-                this.fileDownloads.enableDownloadButtons();
-                this.resetViewButton.disabled = false;
-                
-                this.statusManager.updateStatus(
-                    `🎉 Success! Generated ${partsData.length} parts for 3D viewer - Model generated successfully!`, 
-                    `Model generated successfully! 🎉 (${partsData.length} parts)`, 
-                    'text-sm status-success'
-                );
-                
+            await this.perfMetrics.measure(record, 'viewer', () => this.displayResults(!options.live));
+            record.sceneGlbBytes = window.sceneGlb ? window.sceneGlb.byteLength : null;
+            record.memory = { ...run.memory, viewer: this.threeViewer.memoryInfo() };
+            
+            if (quality === 'coarse') {
+                this.scheduleRefine();
             } else {
-                this.consoleManager.appendToConsole('❌ No model data generated');
-                throw new Error('No model data generated');
+                this.schedulePrefetch();
             }
             
         } catch (error) {
+            if (error instanceof BuildCancelledError) {
+                // a newer request replaced this build; its own result follows
+                record.superseded = true;
+                return;
+            }
+            record.error = error.message;
             this.consoleManager.appendToConsole(`Runtime Error: ${error.message}`);
             this.statusManager.updateStatus(`❌ Outer Runtime Error: ${error.message}`, 'Generation failed ❌', 'text-sm status-error');
         } finally {
-            // Reset button state
-            this.runButton.disabled = false;
-            this.runText.innerHTML = 'Generate Model';
-            this.runText.parentElement.classList.remove('loading');
+            this.perfMetrics.finish(record);
+            // Reset button state once no build is left
+            if (!this.pythonRuntime.isBuilding()) {
+                this.runButton.disabled = false;
+                this.runText.innerHTML = 'Generate Model';
+                this.runText.parentElement.classList.remove('loading');
+            }
         }
     }
 
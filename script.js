@@ -1172,7 +1172,7 @@ async function reloadParameterDefinitions() {
         });
         
         // Re-fetch the script
-        const response = await fetch('generate.py?' + Date.now()); // Cache-busting
+        const response = await fetch('generate.py', { cache: 'no-cache' }); // revalidated with the server's ETag
         const scriptContent = await response.text();
         
         // Parse new parameter definitions
@@ -2,45 +2,663 @@
 """
 Simple HTTP server for serving the Python WebAssembly project locally.
 This handles CORS properly and provides a convenient way to run the project.
+
+Requests are served by a thread per connection, with:
+  - precompressed .br/.gz variants (create them with --precompress)
+  - ETag/Last-Modified conditional GETs
+  - byte Range requests for large files such as wheels
+  - long-lived immutable caching for versioned assets (wheels, content-hashed
+    file names) while everything else, generate.py and export.py included, is
+    revalidated on every load
+
+GET /events is a Server-Sent Events stream of the model scripts' content
+hashes: a "scripts" event with every hash when a page connects, then a
+"change" event whenever a watched file's content changes (--watch, default
+generate.py and export.py). The page reloads generate.py only then.
+
+Every response carries Cross-Origin-Opener-Policy: same-origin and
+Cross-Origin-Embedder-Policy: credentialless, which make the page
+cross-origin isolated: SharedArrayBuffer is then available, and the page
+uses it to interrupt a Pyodide build that a newer parameter change has made
+stale (--no-isolation turns the headers off).
+
+With --native, POST /build runs generate.py and export.py with native
+build123d in a pool of worker processes (see native.py). Identical requests
+that arrive while a build is running share its result, and every response is
+kept in a content-addressed artifact store on disk (--artifacts, bounded by
+--artifacts-mb) keyed on the scripts, the parameter values and the export
+options, so a configuration built before is answered without OCCT. GET /build reports
+whether the endpoint is enabled; the browser falls back to Pyodide without it.
+/build runs the model on the posted parameters, so it answers only clients on this
+machine (--build-remote to allow others), sends no CORS headers and refuses
+requests whose Origin is not this server.
 """
 
+import argparse
+import email.utils
+import errno
+import gzip
+import hashlib
 import http.server
-import socketserver
+import ipaddress
+import json
 import os
+import queue
+import re
 import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from urllib.parse import urlsplit
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings we may have precompressed variants for, in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# Text-like files worth precompressing (wheels and images are already compressed)
+COMPRESSIBLE = {'.html', '.js', '.mjs', '.css', '.py', '.json', '.svg', '.txt', '.md', '.wasm'}
+
+# Versioned assets that never change once published
+VERSIONED = re.compile(r'(\.whl$)|(\.[0-9a-f]{8,}\.\w+$)')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Largest /build request body accepted
+MAX_BUILD_REQUEST = 1024 * 1024
+
+
+class ArtifactStore:
+    """Build response frames on disk by content hash, evicting the least recently used beyond budget bytes."""
+
+    def __init__(self, root, budget):
+        self.root = Path(root)
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.size = sum(path.stat().st_size for path in self.files())
+
+    def files(self):
+        return [path for path in self.root.glob('*/*') if path.is_file() and not path.name.endswith('.part')]
+
+    def path(self, key):
+        return self.root / key[:2] / key
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # mark as recently used
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self.path(key)
+        path.parent.mkdir(exist_ok=True)
+        partial = path.with_name(f'{key}.{threading.get_ident()}.part')
+        partial.write_bytes(data)
+        existed = path.exists()
+        os.replace(partial, path)
+        with self.lock:
+            if not existed:
+                self.size += len(data)
+            if self.size > self.budget:
+                self.evict()
+
+    def evict(self):
+        # oldest first, down to 90% of the budget so eviction does not run on every put
+        entries = sorted(self.files(), key=lambda path: path.stat().st_mtime)
+        self.size = sum(path.stat().st_size for path in entries)
+        for path in entries:
+            if self.size <= self.budget * 0.9:
+                break
+            size = path.stat().st_size
+            path.unlink(missing_ok=True)
+            self.size -= size
+
+    def stats(self):
+        with self.lock:
+            return {'bytes': self.size, 'budget': self.budget, 'hits': self.hits, 'misses': self.misses}
+
+
+def artifact_key(request, sources):
+    """Content hash of a build: the scripts, the parameter values and the export options.
+
+    A full parameter JSON is reduced to its values, so labels or ranges do not split the cache.
+    """
+    request = dict(request)
+    try:
+        data = json.loads(request.get('customData') or 'null')
+        if isinstance(data, dict) and 'children' in data:
+            request['customData'] = {param['name']: param['value'] for param in data['children']}
+    except (TypeError, ValueError, KeyError):
+        pass
+
+    digest = hashlib.sha256()
+    for source in sources:
+        digest.update(hashlib.sha256(source.encode()).digest())
+    digest.update(json.dumps(request, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class NativeBuilder:
+    """Runs native builds in a process pool, coalescing identical in-flight requests."""
+
+    # Scripts besides generate.py whose content is part of the artifact key
+    SOURCES = ('export.py', 'utils.py')
+
+    def __init__(self, workers, store=None):
+        import native
+        self.native = native
+        self.workers = workers
+        self.store = store
+        self.lock = threading.RLock()
+        self.in_flight = {}
+        self.builds = 0
+        self.coalesced = 0
+        self.pool = self.create_pool()
+
+    def create_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=self.native.warm_up)
+
+    def build(self, request):
+        """Return the response frame for request: stored, from a running build, or built."""
+        source = self.native.read_generate()
+        sources = [source]
+        for name in self.SOURCES:
+            path = Path(self.native.ROOT) / name
+            sources.append(path.read_text(encoding='utf-8') if path.exists() else '')
+        key = artifact_key(request, sources)
+
+        if self.store is not None:
+            frame = self.store.get(key)
+            if frame is not None:
+                return frame
+
+        with self.lock:
+            pool = self.pool
+            future = self.in_flight.get(key)
+            if future is None:
+                try:
+                    future = pool.submit(self.native.build, request, source)
+                except BrokenProcessPool:
+                    self.restart(pool)
+                    raise
+                self.in_flight[key] = future
+                self.builds += 1
+                future.add_done_callback(lambda done: self.finished(key, done))
+            else:
+                self.coalesced += 1
+
+        try:
+            frame = future.result()
+        except BrokenProcessPool:
+            self.restart(pool)
+            raise
+        return frame
+
+    def restart(self, pool):
+        """Replace a pool broken by a dead worker (e.g. an OCCT crash), once."""
+        with self.lock:
+            if self.pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self.create_pool()
+
+    def finished(self, key, future):
+        # stored once, by the build itself rather than by each waiter, before later requests
+        # stop finding it in flight
+        try:
+            if self.store is not None and not future.cancelled() and future.exception() is None:
+                self.store.put(key, future.result())
+        finally:
+            with self.lock:
+                if self.in_flight.get(key) is future:
+                    del self.in_flight[key]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'native': True,
+                'workers': self.workers,
+                'inFlight': len(self.in_flight),
+                'builds': self.builds,
+                'coalesced': self.coalesced,
+                'artifacts': self.store.stats() if self.store is not None else None,
+            }
+
+
+class ScriptWatcher:
+    """Polls the mtimes of the model scripts and notifies subscribers when a file's content hash changes."""
+
+    def __init__(self, paths, interval=0.5):
+        self.paths = [Path(path) for path in paths]
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.mtimes = {}
+        self.hashes = {}
+        for path in self.paths:
+            self.check(path)
+        threading.Thread(target=self.run, name='script-watcher', daemon=True).start()
+
+    def check(self, path):
+        """Re-hash path if its mtime changed; True if its content changed."""
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if self.mtimes.get(path.name, 0) == mtime:
+            return False
+
+        self.mtimes[path.name] = mtime
+        digest = hashlib.sha256(path.read_bytes()).hexdigest() if mtime is not None else None
+        if self.hashes.get(path.name) == digest:
+            # touched or rewritten with the same content
+            return False
+        self.hashes[path.name] = digest
+        return True
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            for path in self.paths:
+                if self.check(path):
+                    event = {'file': path.name, 'hash': self.hashes[path.name]}
+                    print(f"🔁 {path.name} changed ({str(event['hash'])[:12]})")
+                    with self.lock:
+                        for subscriber in self.subscribers:
+                            subscriber.put(event)
+
+    def subscribe(self):
+        events = queue.Queue()
+        with self.lock:
+            self.subscribers.add(events)
+        return events
+
+    def unsubscribe(self, events):
+        with self.lock:
+            self.subscribers.discard(events)
+
 
 class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     """HTTP request handler with CORS headers."""
-    
+
+    extensions_map = {
+        **http.server.SimpleHTTPRequestHandler.extensions_map,
+        '.mjs': 'text/javascript',
+        '.wasm': 'application/wasm',
+        '.whl': 'application/zip',
+    }
+
+    # Set by main() for --no-cache, --no-isolation, --native and --watch
+    no_cache = False
+    isolate = True
+    build_remote = False
+    builder = None
+    watcher = None
+
+    # Seconds between keep-alive comments on /events (they also detect closed pages)
+    EVENTS_KEEPALIVE = 15
+
     def end_headers(self):
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+        # /build runs generate.py on the posted parameters: no cross-origin access to it
+        if not self.is_build_path():
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        if self.isolate:
+            # cross-origin isolation, for SharedArrayBuffer; credentialless still lets
+            # the CDN scripts load without Cross-Origin-Resource-Policy headers
+            self.send_header('Cross-Origin-Opener-Policy', 'same-origin')
+            self.send_header('Cross-Origin-Embedder-Policy', 'credentialless')
+            self.send_header('Cross-Origin-Resource-Policy', 'cross-origin')
         super().end_headers()
 
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def is_build_path(self):
+        return self.path.split('?', 1)[0] == '/build'
+
+    def build_forbidden(self):
+        """Why a /build request is refused, or None: only pages served by this server,
+        on this machine (unless --build-remote), may run builds."""
+        if not self.build_remote and not ipaddress.ip_address(self.client_address[0]).is_loopback:
+            return "Native builds are only served to this machine (see --build-remote)"
+        origin = self.headers.get('Origin')
+        if origin is not None and urlsplit(origin).netloc != self.headers.get('Host'):
+            return "Cross-origin native build requests are not allowed"
+        return None
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if self.is_build_path() and self.builder is not None:
+            forbidden = self.build_forbidden()
+            if forbidden:
+                self.send_json(403, {'error': forbidden})
+            else:
+                self.send_json(200, self.builder.stats())
+            return
+        if self.path.split('?', 1)[0] == '/events' and self.watcher is not None:
+            self.send_events()
+            return
+        super().do_GET()
+
+    def send_event(self, event, data):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+
+    def send_events(self):
+        """Stream script hash changes until the page goes away."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.close_connection = True
+
+        events = self.watcher.subscribe()
+        try:
+            self.send_event('scripts', dict(self.watcher.hashes))
+            while True:
+                try:
+                    event = events.get(timeout=self.EVENTS_KEEPALIVE)
+                except queue.Empty:
+                    self.wfile.write(b': keep-alive\n\n')
+                    self.wfile.flush()
+                    continue
+                self.send_event('change', event)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.watcher.unsubscribe(events)
+
+    def do_POST(self):
+        if not self.is_build_path() or self.builder is None:
+            self.send_error(404, "No native build endpoint (start the server with --native)")
+            return
+        forbidden = self.build_forbidden()
+        if forbidden:
+            self.send_json(403, {'error': forbidden})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BUILD_REQUEST:
+            self.send_error(413, "Build request too large")
+            return
+
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError("Build request must be a JSON object")
+            self.builder.native.check_request(request)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+
+        try:
+            frame = self.builder.build(request)
+        except self.builder.native.NativeBuildError as e:
+            self.send_json(422, {'error': e.message, 'output': e.output})
+            return
+        except BrokenProcessPool:
+            self.send_json(503, {'error': 'Native build worker crashed'})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(frame)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(frame)
+
+    def cache_control(self, path):
+        if self.no_cache:
+            return 'no-cache, no-store, must-revalidate'
+        return IMMUTABLE if VERSIONED.search(path) else REVALIDATE
+
+    def accepted_encodings(self):
+        accepted = set()
+        for token in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = token.strip().partition(';')
+            q = params.strip()
+            if q.startswith('q='):
+                try:
+                    if float(q[2:] or 0) == 0:
+                        continue
+                except ValueError:
+                    # malformed q-value: treat the encoding as not acceptable
+                    continue
+            accepted.add(name.strip().lower())
+        return accepted
+
+    def select_variant(self, path):
+        """Return (encoding, file) for the best up-to-date precompressed variant, if any."""
+        accepted = self.accepted_encodings()
+        mtime = os.stat(path).st_mtime
+        for encoding, suffix in ENCODINGS:
+            variant = path + suffix
+            if encoding in accepted and os.path.isfile(variant) and os.stat(variant).st_mtime >= mtime:
+                return encoding, variant
+        return None, path
+
+    def not_modified(self, etag, mtime):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return since is not None and int(mtime) <= since.timestamp()
+
+        return False
+
+    def parse_range(self, size, etag, mtime):
+        """(start, end) of a single byte range, None for the full file, False if unsatisfiable."""
+        header = self.headers.get('Range')
+        if not header or not header.startswith('bytes=') or ',' in header:
+            return None
+
+        # If-Range: only honour the range if the file has not changed
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range != etag and if_range != self.date_time_string(int(mtime)):
+            return None
+
+        first, _, last = header[len('bytes='):].strip().partition('-')
+        try:
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            else:
+                start = max(size - int(last), 0)
+                end = size - 1
+        except ValueError:
+            return None
+
+        if start > end or start >= size:
+            return False
+        return start, end
+
+    def send_head(self):
+        self._remaining = None
+        path = self.translate_path(self.path)
+
+        if os.path.isdir(path):
+            index = os.path.join(path, 'index.html')
+            if not self.path.split('?', 1)[0].endswith('/') or not os.path.isfile(index):
+                # let the base class redirect to the trailing slash or list the directory
+                return super().send_head()
+            path = index
+
+        if not os.path.isfile(path):
+            self.send_error(404, "File not found")
+            return None
+
+        encoding, served = self.select_variant(path)
+        stat = os.stat(served)
+        size = stat.st_size
+        etag = f'"{stat.st_mtime_ns:x}-{size:x}{"-" + encoding if encoding else ""}"'
+        cache_control = self.cache_control(path)
+
+        if self.not_modified(etag, stat.st_mtime):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return None
+
+        # Ranges are only served from the identity encoding
+        byte_range = self.parse_range(size, etag, stat.st_mtime) if encoding is None else None
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+
+        f = open(served, 'rb')
+        start, end = byte_range or (0, size - 1)
+        self._remaining = end - start + 1
+
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Length', str(self._remaining))
+        self.send_header('Last-Modified', self.date_time_string(int(stat.st_mtime)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Accept-Ranges', 'bytes')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if byte_range:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+
+        f.seek(start)
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, '_remaining', None)
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+
+        while remaining > 0:
+            chunk = source.read(min(64 * 1024, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+        self._remaining = None
+
+
+def precompress(root):
+    """Write .gz (and .br when the brotli module is installed) next to every compressible file."""
+    count = 0
+    for path in Path(root).rglob('*'):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE or path.stat().st_size < 1024:
+            continue
+        if any(part.startswith('.') for part in path.relative_to(root).parts):
+            continue
+
+        data = path.read_bytes()
+        mtime = path.stat().st_mtime
+        variants = [('.gz', lambda d: gzip.compress(d, 9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', lambda d: brotli.compress(d, quality=11)))
+
+        for suffix, compress in variants:
+            target = path.with_name(path.name + suffix)
+            if target.exists() and target.stat().st_mtime >= mtime:
+                continue
+            target.write_bytes(compress(data))
+            count += 1
+
+    print(f"🗜️  Wrote {count} precompressed file(s){'' if brotli else ' (gzip only, install brotli for .br)'}")
+
+
 def main():
-    port = 8000
-    
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8000, help='first port to try (default: 8000)')
+    parser.add_argument('--bind', default='', help='address to bind (default: all interfaces)')
+    parser.add_argument('--precompress', action='store_true', help='write .gz/.br variants of static files and exit')
+    parser.add_argument('--no-cache', action='store_true', help='disable browser caching entirely (old behaviour)')
+    parser.add_argument('--no-isolation', action='store_true',
+                        help='do not send COOP/COEP headers (builds can then not be interrupted)')
+    parser.add_argument('--native', action='store_true', help='serve POST /build with native build123d worker processes')
+    parser.add_argument('--build-remote', action='store_true',
+                        help='serve /build to other hosts too (by default only to 127.0.0.1/::1)')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='native build processes (default: half the CPUs)')
+    parser.add_argument('--artifacts', default='.artifacts', metavar='DIR',
+                        help='artifact store of native builds (default: .artifacts; empty to disable)')
+    parser.add_argument('--artifacts-mb', type=int, default=512, help='artifact store size limit (default: 512 MB)')
+    parser.add_argument('--watch', nargs='*', default=['generate.py', 'export.py'], metavar='FILE',
+                        help='scripts whose changes are pushed on /events (default: generate.py export.py; none to disable)')
+    args = parser.parse_args()
+
+    if args.precompress:
+        precompress(Path.cwd())
+        return
+
+    CORSHTTPRequestHandler.no_cache = args.no_cache
+    CORSHTTPRequestHandler.isolate = not args.no_isolation
+    CORSHTTPRequestHandler.build_remote = args.build_remote
+    if args.native:
+        store = ArtifactStore(args.artifacts, args.artifacts_mb * 1024 * 1024) if args.artifacts else None
+        CORSHTTPRequestHandler.builder = NativeBuilder(args.workers, store)
+    if args.watch:
+        CORSHTTPRequestHandler.watcher = ScriptWatcher(args.watch)
+    port = args.port
+
     # Try to use a different port if 8000 is busy
     for attempt_port in range(port, port + 10):
         try:
-            with socketserver.TCPServer(("", attempt_port), CORSHTTPRequestHandler) as httpd:
+            with http.server.ThreadingHTTPServer((args.bind, attempt_port), CORSHTTPRequestHandler) as httpd:
                 print(f"🚀 Starting Python WebAssembly server...")
                 print(f"📡 Server running at: http://localhost:{attempt_port}")
                 print(f"📁 Serving files from: {Path.cwd()}")
+                if args.native:
+                    print(f"🔧 Native builds: POST /build ({args.workers} worker process(es))")
+                if args.watch:
+                    print(f"👀 Watching {', '.join(args.watch)}: GET /events")
                 print(f"🛑 Press Ctrl+C to stop the server")
                 print(f"")
                 print(f"🌐 Open your browser and navigate to: http://localhost:{attempt_port}")
                 httpd.serve_forever()
         except OSError as e:
-            if e.errno == 48:  # Address already in use
+            if e.errno in (errno.EADDRINUSE, 48):  # Address already in use
                 print(f"Port {attempt_port} is busy, trying {attempt_port + 1}...")
                 continue
             else:
                 raise
-    
+
     print(f"❌ Could not find an available port in range {port}-{port + 9}")
     sys.exit(1)
 
@@ -52,4 +670,4 @@ if __name__ == "__main__":
         sys.exit(0)
     except Exception as e:
         print(f"❌ Error starting server: {e}")
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Batch parameter sweeps (design of experiments) of generate.py on a process pool.
+
+    python sweep.py --shape box --range length=40:200:5 --formats stl step -o box_lengths.zip
+    python sweep.py --shape box --values width=30,60 --range height=5:20:5 -o grid.zip
+    python sweep.py --params my_params.json --range radius=10:50:10 --mode zip --range height=20:100:20
+
+Ranges are inclusive (start:stop:step); --values lists explicit values. By
+default every combination is built (--mode grid); --mode zip pairs the i-th
+values of each parameter instead. Builds run in native worker processes (see
+native.py). The archive holds:
+
+    variants/<key>/<part>.<format>
+    variants/<key>/manifest.json     parameter values and metrics of the variant
+    manifest.json                    every variant of the sweep
+
+<key> is a hash of the variant's parameter values, the export formats and the
+content of generate.py and export.py, so a variant is only reused when it
+would be built the same way. Each finished variant is first written to its
+own file in <archive>.variants/ (complete, or not at all). The archive is
+rewritten from those when the sweep ends, under a temporary name that
+replaces the old archive once complete. A killed sweep leaves the previous
+archive readable, and running the same command again resumes it: variants
+already in the archive or staged are skipped, and failed ones are retried.
+
+From Python, pass a ParameterGroup to run_sweep().
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import shutil
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import native
+
+MANIFEST = 'manifest.json'
+
+
+def parse_values(spec, param_type='num'):
+    """'a:b:step' (inclusive) or 'v1,v2,...' to a list of values."""
+    if ':' in spec:
+        start, stop, step = (float(v) for v in spec.split(':'))
+        if step <= 0:
+            raise ValueError(f"Step must be positive in '{spec}'")
+        count = math.floor((stop - start) / step + 1e-9) + 1
+        return [round(start + i * step, 10) for i in range(count)]
+
+    values = [v.strip() for v in spec.split(',') if v.strip()]
+    if param_type == 'num':
+        return [float(v) for v in values]
+    if param_type == 'bool':
+        return [v.lower() in ('1', 'true', 'yes') for v in values]
+    return values
+
+
+def variants(definition, ranges, mode='grid'):
+    """Parameter value dicts for each variant: every combination (grid) or the i-th value of each (zip)."""
+    names = list(ranges)
+    known = {param['name'] for param in definition['children']}
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise ValueError(f"Unknown parameter(s) {unknown}. Expected some of: {sorted(known)}")
+
+    if mode == 'zip':
+        lengths = {len(ranges[name]) for name in names}
+        if len(lengths) > 1:
+            raise ValueError("--mode zip needs the same number of values for every parameter")
+        combinations = zip(*(ranges[name] for name in names))
+    else:
+        combinations = itertools.product(*(ranges[name] for name in names))
+
+    return [dict(zip(names, combination)) for combination in combinations]
+
+
+def scripts_hash():
+    """Content hash of the scripts a variant is built with."""
+    digest = hashlib.sha256()
+    for path in (native.GENERATE_PATH, os.path.join(native.ROOT, 'export.py')):
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def variant_data(definition, changes, formats=(), scripts=''):
+    """The _custom_data JSON of a variant and its key, a hash of its parameter values,
+    the export formats and the scripts (see scripts_hash())."""
+    data = json.loads(json.dumps(definition))
+    for param in data['children']:
+        if param['name'] in changes:
+            param['value'] = changes[param['name']]
+
+    values = {param['name']: param['value'] for param in data['children']}
+    identity = {'values': values, 'formats': sorted(formats), 'scripts': scripts}
+    key = hashlib.sha1(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+    return json.dumps(data), key
+
+
+def build_variant(data, formats):
+    """Worker: build one variant, returning (header, buffers) or an error message."""
+    try:
+        frame = native.build({'customData': data, 'formats': formats, 'preview': False})
+    except native.NativeBuildError as e:
+        return None, str(e)
+
+    header = native.read_header(frame)
+    buffers = [frame[offset:offset + length] for offset, length in header['buffers']]
+    return header, buffers
+
+
+def metrics(report):
+    """Phase totals (ms, by phase name) and per-part sizes from a PhaseTimer report."""
+    phases = {}
+    for entry in report['phases']:
+        phases[entry['phase']] = round(phases.get(entry['phase'], 0) + entry['ms'], 2)
+    return {'phases_ms': phases, 'parts': report['parts']}
+
+
+def staging_dir(archive):
+    return archive + '.variants'
+
+
+def sources(archive):
+    """The archive (if any) and the staged variant files, oldest first."""
+    paths = [archive] if os.path.exists(archive) else []
+    staged = staging_dir(archive)
+    if os.path.isdir(staged):
+        paths += sorted(os.path.join(staged, name) for name in os.listdir(staged) if name.endswith('.zip'))
+    return paths
+
+
+def variant_manifests(archive):
+    """The manifest of every variant in the archive or staged, by key."""
+    entries = {}
+    for path in sources(archive):
+        try:
+            with zipfile.ZipFile(path) as zf:
+                for name in zf.namelist():
+                    if name.startswith('variants/') and name.endswith('/' + MANIFEST):
+                        entry = json.loads(zf.read(name))
+                        entries[entry['key']] = entry
+        except zipfile.BadZipFile:
+            raise SystemExit(f"❌ {path} is not a readable archive. Move it away to start over.")
+    return entries
+
+
+def stage_variant(archive, key, files):
+    """Write a finished variant ({name: bytes}) to its own file, renamed into place when complete."""
+    staged = staging_dir(archive)
+    os.makedirs(staged, exist_ok=True)
+    path = os.path.join(staged, f'{key}.zip')
+    with zipfile.ZipFile(path + '.tmp', 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    os.replace(path + '.tmp', path)
+
+
+def write_archive(archive, manifest):
+    """Merge the archive, the staged variants of the manifest and the manifest itself into a
+    new archive that replaces the old one when complete, then drop the staged files.
+    Variants the manifest does not list (other values, formats or scripts) are left out."""
+    partial = archive + '.part'
+    keep = {entry['key'] for entry in manifest['variants']}
+    written = set()
+    with zipfile.ZipFile(partial, 'w', zipfile.ZIP_DEFLATED) as target:
+        # staged variants are newer than the archive: copy them first
+        for path in reversed(sources(archive)):
+            with zipfile.ZipFile(path) as source:
+                for info in source.infolist():
+                    parts = info.filename.split('/')
+                    if info.filename in written or parts[0] != 'variants' or parts[1] not in keep:
+                        continue
+                    with source.open(info) as src, target.open(info, 'w') as dst:
+                        shutil.copyfileobj(src, dst)
+                    written.add(info.filename)
+        target.writestr(MANIFEST, json.dumps(manifest, indent=2))
+    os.replace(partial, archive)
+    shutil.rmtree(staging_dir(archive), ignore_errors=True)
+
+
+def run_sweep(group, ranges, archive, formats=('stl',), mode='grid', workers=None):
+    """Build every variant of group (a ParameterGroup) over ranges ({name: [values]}) into archive.
+
+    Returns the manifest written to the archive.
+    """
+    definition = json.loads(group.dumps())
+    scripts = scripts_hash()
+    pending = []
+    done = set(variant_manifests(archive))
+    keys = []
+    for changes in variants(definition, ranges, mode):
+        data, key = variant_data(definition, changes, formats, scripts)
+        keys.append(key)
+        if key not in done:
+            pending.append((key, changes, data))
+
+    total = len(keys)
+    print(f"🧪 {total} variant(s), {total - len(pending)} already in {archive}, building {len(pending)}...")
+
+    workers = workers or os.cpu_count() or 1
+    failed = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=native.warm_up) as pool:
+        # keep a bounded number of builds in flight so finished frames do not pile up in memory
+        queue = iter(pending)
+        in_flight = {}
+        finished = 0
+        while True:
+            while len(in_flight) < workers * 2:
+                item = next(queue, None)
+                if item is None:
+                    break
+                key, changes, data = item
+                in_flight[pool.submit(build_variant, data, list(formats))] = (key, changes)
+            if not in_flight:
+                break
+
+            ready, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in ready:
+                key, changes = in_flight.pop(future)
+                header, result = future.result()
+                finished += 1
+                if header is None:
+                    failed.append({'key': key, 'values': changes, 'error': result})
+                    print(f"  [{finished}/{len(pending)}] ❌ {changes}: {result}")
+                    continue
+
+                files = {}
+                for export in header['exports']:
+                    files[f"variants/{key}/{export['name']}.{export['format']}"] = result[export['data']['buffer']]
+                files[f'variants/{key}/{MANIFEST}'] = json.dumps({
+                    'key': key,
+                    'values': changes,
+                    'files': list(files),
+                    'metrics': metrics(header['perf']),
+                }, indent=2)
+                stage_variant(archive, key, files)
+                print(f"  [{finished}/{len(pending)}] ✅ {changes}")
+
+    entries = variant_manifests(archive)
+    with open(native.GENERATE_PATH, 'rb') as f:
+        generate_hash = hashlib.sha256(f.read()).hexdigest()
+
+    manifest = {
+        'generate.py': generate_hash,
+        'scripts': scripts,
+        'base': definition,
+        'ranges': ranges,
+        'mode': mode,
+        'formats': list(formats),
+        'variants': [entries[key] for key in keys if key in entries],
+        'failed': failed,
+    }
+    write_archive(archive, manifest)
+    print(f"📦 {len(manifest['variants'])}/{total} variant(s) in {archive} "
+          f"({time.perf_counter() - start:.1f} s, {len(failed)} failed)")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--shape', help="entry of generate.py's index to start from")
+    source.add_argument('--params', help='ParameterGroup JSON (as published in window.jsonData) to start from')
+    parser.add_argument('--range', action='append', default=[], metavar='NAME=START:STOP:STEP', help='inclusive range of a parameter')
+    parser.add_argument('--values', action='append', default=[], metavar='NAME=V1,V2,...', help='explicit values of a parameter')
+    parser.add_argument('--mode', choices=('grid', 'zip'), default='grid', help='combine parameters as a grid or pairwise (default: grid)')
+    parser.add_argument('--formats', nargs='+', default=['stl'], help='export formats (default: stl)')
+    parser.add_argument('--workers', type=int, help='build processes (default: one per CPU)')
+    parser.add_argument('-o', '--output', default='sweep.zip', help='archive to write or resume (default: sweep.zip)')
+    args = parser.parse_args()
+
+    native.warm_up()
+    from utils import ParameterGroup, loadParam
+
+    if args.params:
+        with open(args.params, encoding='utf-8') as f:
+            group = loadParam(f.read())
+    else:
+        index, _ = native.load_index()
+        if args.shape not in index:
+            raise SystemExit(f"❌ Unknown shape '{args.shape}'. Expected one of: {list(index)}")
+        group = ParameterGroup(list(index[args.shape]))
+
+    types = {param.name: param.type for param in group.children}
+    ranges = {}
+    for spec in args.range + args.values:
+        name, _, values = spec.partition('=')
+        try:
+            ranges[name] = parse_values(values, types.get(name, 'num'))
+        except ValueError as e:
+            parser.error(f"bad values for '{name}': {e}")
+    if not ranges:
+        parser.error('give at least one --range or --values')
+    unknown = [name for name in ranges if name not in types]
+    if unknown:
+        parser.error(f"unknown parameter(s) {', '.join(unknown)}; expected some of: {', '.join(types)}")
+
+    run_sweep(group, ranges, args.output, args.formats, args.mode, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""generate.py under utils.ModelSession with native build123d: python -m pytest -q"""
+
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip('build123d')
+
+import utils
+from utils import ModelSession, build_cache, perf
+
+with open(os.path.join(ROOT, 'generate.py'), encoding='utf-8') as f:
+    SOURCE = f.read()
+
+
+def delta(**changes):
+    return json.dumps({'v': utils.PARAM_PROTOCOL, 'changes': changes})
+
+
+@pytest.fixture
+def session():
+    """A fresh session with the shared build cache emptied and its counters at zero."""
+    build_cache.clear()
+    build_cache.hits = build_cache.misses = 0
+    return ModelSession(namespace={'__name__': 'generate'})
+
+
+def build(session, data=None):
+    perf.reset()
+    return session.run(SOURCE, data)
+
+
+def snapshot(session):
+    """What a build reports: cache counters, stages run and the phases timed."""
+    return (
+        build_cache.hits,
+        build_cache.misses,
+        session.namespace['stages'].stats(),
+        [phase['phase'] for phase in perf.report()['phases']],
+    )
+
+
+def test_rejected_shape_leaves_group_unchanged(session):
+    p, _ = build(session)
+    before = p.dumps()
+
+    with pytest.raises(ValueError, match='Unknown shape'):
+        build(session, delta(shape='pyramid', xsize=10.0))
+
+    assert session.namespace['p'] is p
+    assert p.dumps() == before
+
+
+def test_prefetch_leaves_build_stats_alone(session):
+    build(session)
+    build(session, delta(zsize=50.0))
+    plain = snapshot(session)
+
+    build_cache.clear()
+    build_cache.hits = build_cache.misses = 0
+    prefetching = ModelSession(namespace={'__name__': 'generate'})
+    build(prefetching)
+    after_build = snapshot(prefetching)
+    assert prefetching.prefetch('xsize', [50.0, 70.0]) == [50.0, 70.0]
+    assert snapshot(prefetching) == after_build
+
+    build(prefetching, delta(zsize=50.0))
+    assert snapshot(prefetching) == plain
@@ -1,11 +1,18 @@
 
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field, fields, replace
+from enum import Enum
+from functools import lru_cache
 from typing import Any
 
 from json import dumps, loads
+from collections import OrderedDict
+from contextlib import contextmanager
+import gc
+import hashlib
+import time
 
 
-@dataclass
+@dataclass(slots=True)
 class P:
     name: str
     type: str
@@ -21,18 +28,62 @@ class P:
     max: float | None = None
     min: float | None = None
     step: float | None = None
+
+    prev: str | None = None
+
+    # build123d enum of 'enum'/'enums' parameters, e.g. 'Align'
+    enum: str | None = None
+
+    # serialized form, cleared whenever a field changes (see dumps)
+    _json: str | None = field(default=None, init=False, repr=False, compare=False)
+    # value parsed by the converter of the type (see converted)
+    _converted: Any = field(default=None, init=False, repr=False, compare=False)
     
     
     def __post_init__(self):
         if self.default is None:
             self.default = self.value
+        # rejects an invalid initial value
+        object.__setattr__(self, '_converted', self.convert(self.value))
             
     def __setattr__(self, name, value):
-        postinit = 'name' in self.__dict__
+        # slotted dataclass: no instance __dict__, and no zero-argument super()
+        postinit = hasattr(self, 'name')
         if postinit and name == 'name':
             print('Renaming after init is PROHIBITED')
-        else:
-            super().__setattr__(name, value)
+            return
+
+        initialized = hasattr(self, '_converted')
+        if initialized and name == 'value':
+            # parse before the value changes, so an invalid value leaves the parameter as it was
+            object.__setattr__(self, '_converted', self.convert(value))
+        object.__setattr__(self, name, value)
+        if initialized and name in ('type', 'enum'):
+            object.__setattr__(self, '_converted', self.convert(self.value))
+        if name not in ('_json', '_converted'):
+            object.__setattr__(self, '_json', None)
+
+    @property
+    def converted(self):
+        """The value as the build uses it: a tuple of floats for 'vec', an enum member for 'enum', ..."""
+        return self._converted
+
+    def convert(self, value):
+        try:
+            return converter(self.type, self.enum)(value)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid value {value!r} for parameter '{self.name}' ({self.type}): {e}") from None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in P_FIELDS}
+
+    def copy(self):
+        return replace(self)
+
+    def dumps(self):
+        if self._json is None:
+            self._json = dumps(self.to_dict())
+        return self._json
             
     def __repr__(self):
                 
@@ -78,7 +129,71 @@ class P:
     # def __bool__(self):
     #     return bool(self.value)
     
-    
+
+P_FIELDS = [f.name for f in fields(P) if not f.name.startswith('_')]
+
+
+# Parsers of the typed parameters. Values stay text in the parameter JSON (the page edits
+# them in a text box); the parsed value is cached on the parameter (P.converted).
+#   vec    '( 0 , 45 , 0 )' or [0, 45, 0]          -> (0.0, 45.0, 0.0)
+#   enum   'Mode.ADD' or 'ADD'                     -> Mode.ADD
+#   enums  '( Align.MIN , Align.CENTER , ... )'    -> (Align.MIN, Align.CENTER, ...)
+# Other types are used as they are.
+def _items(value):
+    if isinstance(value, str):
+        value = value.strip()
+        if value[:1] in '([' and value[-1:] in ')]':
+            value = value[1:-1]
+        return [item.strip() for item in value.split(',') if item.strip()]
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def _vec(value):
+    items = _items(value)
+    if len(items) != 3:
+        raise ValueError(f'expected 3 numbers, got {len(items)}')
+    return tuple(float(item) for item in items)
+
+
+def _member(enum, value):
+    if isinstance(value, enum):
+        return value
+    text = str(value).strip()
+    prefix, _, member = text.rpartition('.')
+    if prefix and prefix != enum.__name__:
+        raise ValueError(f'expected a member of {enum.__name__}')
+    try:
+        return enum[member]
+    except KeyError:
+        raise ValueError(f"expected one of {', '.join(enum.__name__ + '.' + m for m in enum.__members__)}") from None
+
+
+@lru_cache(maxsize=None)
+def converter(kind, enum=None):
+    """The parser of a parameter type, looked up once per (type, enum)."""
+    if kind == 'vec':
+        return _vec
+    if kind not in ('enum', 'enums'):
+        return lambda value: value
+
+    import build123d
+    enum_class = getattr(build123d, enum or '', None)
+    if not (isinstance(enum_class, type) and issubclass(enum_class, Enum)):
+        raise ValueError(f"'{enum}' is not a build123d enum")
+    if kind == 'enum':
+        return lambda value: _member(enum_class, value)
+
+    def members(value):
+        items = [_member(enum_class, item) for item in _items(value)]
+        if not 1 <= len(items) <= 3:
+            raise ValueError(f'expected 1 to 3 {enum_class.__name__} members, got {len(items)}')
+        return items[0] if len(items) == 1 else tuple(items)
+    return members
+
+# version of the {"v": ..., "changes": {...}} parameter deltas sent by the page
+PARAM_PROTOCOL = 1
     
   
 @dataclass 
@@ -134,18 +249,373 @@ class ParameterGroup:
             self._child_map[param.name] = param
     
     def dumps(self):
-        return dumps(asdict(self))
+        # same JSON as dumps(asdict(self)), reusing each child's cached serialization
+        children = ', '.join(child.dumps() for child in self.children)
+        return f'{{"children": [{children}], "name": {dumps(self.name)}}}'
+
+    def key(self, names=None):
+        # stable hash of the parameter values (or only the named ones present), used to look up cached builds
+        values = {c.name: c.value for c in self.children if names is None or c.name in names}
+        return hashlib.sha1(dumps(values, sort_keys=True).encode()).hexdigest()
     
     def load(self, data):
         pass
 
+    def update(self, changes):
+        """Set the values of the named parameters."""
+        unknown = [name for name in changes if name not in self._child_map]
+        if unknown:
+            raise ValueError(f'Unknown parameter(s) {unknown}')
+        # validate every value before changing any
+        for name, value in changes.items():
+            self._child_map[name].convert(value)
+        for name, value in changes.items():
+            self._child_map[name].value = value
 
-def loadParam(data):
+
+def loadParam(data, live=None):
     
     if type(data) == str:
         data = loads(data)
+
+    # delta from the page: only the changed values, applied to the group of the previous build
+    if 'v' in data:
+        if data['v'] != PARAM_PROTOCOL:
+            raise ValueError(f"Unsupported parameter protocol version {data['v']}")
+        if live is None:
+            raise ValueError('Parameter changes need the ParameterGroup of a previous build')
+        live.update(data['changes'])
+        return live
     
     if 'children' in data:
         return ParameterGroup (name=data['name'], children= [ loadParam(param) for param in data['children'] ] )
     else:
-        return P(**data)
\ No newline at end of file
+        return P(**data)
+
+
+class BuildCache:
+    """LRU of built outputs keyed on ParameterGroup.key(), bounded by a memory budget.
+
+    The size of an entry is the bytes of the exports export.py attached to its
+    parts plus a fixed estimate for each part's OCCT geometry.
+    """
+
+    PART_ESTIMATE = 64 * 1024
+
+    def __init__(self, budget=64 * 1024 * 1024):
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __contains__(self, params):
+        # without counting a hit or a miss
+        return params.key() in self._entries
+
+    def get(self, params):
+        key = params.key()
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        self.misses += 1
+        return None
+
+    def put(self, params, output):
+        key = params.key()
+        self._entries[key] = output
+        self._entries.move_to_end(key)
+        self.trim()
+
+    def entry_size(self, output):
+        size = 0
+        for part_info in output:
+            size += self.PART_ESTIMATE
+            for data in part_info.get('_exports', {}).values():
+                # the display mesh is a dict of arrays, the file formats are plain buffers
+                buffers = data.values() if isinstance(data, dict) else [data]
+                size += sum(getattr(b, 'nbytes', len(b)) for b in buffers)
+        return size
+
+    def size(self):
+        return sum(self.entry_size(output) for output in self._entries.values())
+
+    def room(self):
+        """Bytes left before the budget is reached."""
+        return self.budget - self.size()
+
+    def trim(self):
+        # always keep the most recent build, even if it alone exceeds the budget
+        while len(self._entries) > 1 and self.size() > self.budget:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size(),
+            'budget': self.budget,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def __repr__(self):
+        s = self.stats()
+        return f"BuildCache: {s['hits']} hits, {s['misses']} misses, {s['entries']} entries, {s['bytes'] / 1024:.0f} / {s['budget'] / 1024:.0f} KiB"
+
+
+build_cache = BuildCache()
+
+
+class PhaseTimer:
+    """Wall time of the phases of one build, plus per-part sizes (published as window.perfData)."""
+
+    def __init__(self):
+        self.phases = []
+        self.parts = {}
+
+    def reset(self):
+        self.phases = []
+        self.parts = {}
+
+    @contextmanager
+    def phase(self, name, part=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = {'phase': name, 'ms': round((time.perf_counter() - start) * 1000, 2)}
+            if part is not None:
+                entry['part'] = part
+            self.phases.append(entry)
+
+    def part(self, name, **values):
+        """Record sizes for a part, e.g. triangles=..., stl_bytes=..."""
+        self.parts.setdefault(name, {'name': name}).update(values)
+
+    def report(self):
+        return {'phases': list(self.phases), 'parts': list(self.parts.values())}
+
+
+perf = PhaseTimer()
+
+
+class StageGraph:
+    """Build stages of a model script, each re-run only when what it reads changed.
+
+        stages = StageGraph()
+
+        @stages.stage(reads=['length', 'width'])
+        def plate(p):
+            return Box(p.length.value, p.width.value, 5)
+
+        @stages.stage(reads=['hole'], after=['plate'])
+        def drilled(p, plate):
+            return plate - Cylinder(p.hole.value, 5)
+
+        part = stages.run(p)
+
+    A stage's key hashes the values of the parameters it reads
+    (ParameterGroup.key(reads)) and the keys of the stages it comes after, so a
+    changed parameter re-runs its stages and everything downstream of them, and
+    every other stage returns its cached output. Stages can only come after stages
+    declared before them, which keeps the graph acyclic. Names a group does not
+    have are ignored, so one graph can serve groups with different parameters.
+    """
+
+    def __init__(self, keep=8):
+        self.keep = keep
+        self.hits = 0
+        self.misses = 0
+        self.ran = []
+        self._stages = OrderedDict()
+        self._outputs = {}
+
+    def stage(self, reads=(), after=(), name=None):
+        def register(fn):
+            stage_name = name or fn.__name__
+            missing = [upstream for upstream in after if upstream not in self._stages]
+            if missing:
+                raise ValueError(f"Stage '{stage_name}' comes after undeclared stage(s) {missing}")
+            self._stages[stage_name] = (fn, tuple(reads), tuple(after))
+            self._outputs[stage_name] = OrderedDict()
+            return fn
+        return register
+
+    def run(self, params, target=None):
+        """Output of target (default: the last stage declared) for params, running stale stages."""
+        target = target or next(reversed(self._stages))
+        self.ran = []
+        keys = {}
+        outputs = {}
+        for name in self._upstream(target):
+            fn, reads, after = self._stages[name]
+            key = hashlib.sha1(dumps([name, params.key(reads), [keys[upstream] for upstream in after]]).encode()).hexdigest()
+            keys[name] = key
+
+            cached = self._outputs[name]
+            if key in cached:
+                cached.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.ran.append(name)
+                with perf.phase(f'stage {name}'):
+                    cached[key] = fn(params, *(outputs[upstream] for upstream in after))
+                while len(cached) > self.keep:
+                    cached.popitem(last=False)
+            outputs[name] = cached[key]
+        return outputs[target]
+
+    def _upstream(self, target):
+        # target and the stages it depends on, in declaration (= topological) order
+        needed = {target}
+        for name in reversed(self._stages):
+            if name in needed:
+                needed.update(self._stages[name][2])
+        return [name for name in self._stages if name in needed]
+
+    def clear(self):
+        for cached in self._outputs.values():
+            cached.clear()
+
+    def stats(self):
+        return {
+            'stages': list(self._stages),
+            'ran': list(self.ran),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def __repr__(self):
+        s = self.stats()
+        return f"StageGraph: ran {', '.join(s['ran']) or 'nothing'} of {len(s['stages'])} stage(s), {s['hits']} hits, {s['misses']} misses"
+
+
+class ModelSession:
+    """A model script (generate.py) compiled once, its namespace kept alive between builds.
+
+    Scripts that define params(data) and build(p) are executed once to define
+    them, then only those two are called for each build. Other scripts are
+    re-run from the cached code object. The script is recompiled only when its
+    content hash changes.
+    """
+
+    def __init__(self, filename='generate.py', namespace=None):
+        self.filename = filename
+        self.namespace = {} if namespace is None else namespace
+        self.digest = None
+        self.code = None
+        self.compiles = 0
+        self.runs = 0
+        self.prefetched = 0
+
+    def structured(self):
+        return callable(self.namespace.get('params')) and callable(self.namespace.get('build'))
+
+    def load(self, source):
+        """Compile and execute source if it changed, dropping the old script's cached
+        builds; returns True if it did."""
+        digest = hashlib.sha256(source.encode()).hexdigest()
+        if digest == self.digest:
+            return False
+
+        self.code = compile(source, self.filename, 'exec')
+        self.compiles += 1
+        # cached builds are keyed on parameter values only: none of them belongs to the new script
+        self.release()
+        # the script sees _session and leaves the build to run()
+        self.namespace['_session'] = self
+        try:
+            exec(self.code, self.namespace)
+        finally:
+            self.namespace.pop('_session', None)
+        # a script that failed or was interrupted half way is executed again next time
+        self.digest = digest
+        return True
+
+    def run(self, source, data=None):
+        """Build with data (see loadParam) and return (p, output)."""
+        namespace = self.namespace
+        namespace['_custom_data'] = data
+        self.runs += 1
+
+        fresh = self.load(source)
+        if self.structured():
+            namespace['p'] = namespace['params'](data)
+            namespace['output'] = namespace['build'](namespace['p'])
+        elif not fresh:
+            # a plain script already ran while it was loaded
+            exec(self.code, namespace)
+
+        return namespace.get('p'), namespace.get('output')
+
+    def prefetch(self, name, values, prepare=None, seconds=2.0):
+        """Build the last build's parameters with name set to each of values, ahead of the user.
+
+        The outputs go to build_cache, after prepare(output) (e.g. tessellating the preview),
+        so stepping to one of the values is a cache hit. Values that are already cached, are
+        invalid or fail to build are skipped. Prefetching stops once seconds have passed, or
+        when an output the size of the last build's would no longer fit in build_cache
+        without evicting anything. Returns the values built.
+
+        The build_cache and stage counters, the stages the last build ran and the perf
+        report are left as the last build set them.
+        """
+        p = self.namespace.get('p')
+        if not self.structured() or not isinstance(p, ParameterGroup) or name not in p._child_map:
+            return []
+
+        graphs = [value for value in self.namespace.values() if isinstance(value, StageGraph)]
+        saved = ([(graph.hits, graph.misses, graph.ran) for graph in graphs],
+                 (build_cache.hits, build_cache.misses),
+                 (perf.phases, perf.parts))
+        perf.reset()
+
+        start = time.perf_counter()
+        size = build_cache.entry_size(self.namespace.get('output') or [])
+        built = []
+        try:
+            for value in values:
+                if time.perf_counter() - start > seconds or size > build_cache.room():
+                    break
+                neighbour = ParameterGroup([param.copy() for param in p.children], name=p.name)
+                try:
+                    neighbour.update({name: value})
+                except ValueError:
+                    continue
+                if neighbour in build_cache:
+                    continue
+
+                try:
+                    output = self.namespace['build'](neighbour)
+                    if prepare is not None:
+                        prepare(output)
+                except Exception:
+                    # a value the model cannot build fails again when the user picks it
+                    continue
+                built.append(value)
+        finally:
+            for graph, (hits, misses, ran) in zip(graphs, saved[0]):
+                graph.hits, graph.misses, graph.ran = hits, misses, ran
+            build_cache.hits, build_cache.misses = saved[1]
+            perf.phases, perf.parts = saved[2]
+        self.prefetched += len(built)
+        return built
+
+    def release(self):
+        """Drop every cached build result (kept builds, stage outputs, exports of the last
+        build) and collect; returns the number of objects freed. The next build starts cold."""
+        build_cache.clear()
+        for value in list(self.namespace.values()):
+            if isinstance(value, StageGraph):
+                value.clear()
+        for part_info in self.namespace.get('_last_output') or []:
+            part_info.pop('_exports', None)
+        return gc.collect()
+
+    def stats(self):
+        return {'compiles': self.compiles, 'runs': self.runs, 'prefetched': self.prefetched, 'digest': self.digest}
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Vendor the Pyodide wheels used by setup.py into a local wheelhouse.
+
+    python wheelhouse.py vendor pyodide-lock.json
+
+pyodide-lock.json is the output of micropip.freeze() from a page that
+resolved its packages normally: open the page with ?freeze and it is
+downloaded once setup.py has finished. Every wheel it lists is downloaded
+into wheels/ and checked against its sha256, and wheels/lock.json is
+written with the local file names. When wheels/lock.json exists, setup.py
+installs exactly those wheels from server.py, without resolving anything,
+and the browser keeps them cached (wheels are served as immutable).
+
+    python wheelhouse.py check
+
+verifies the vendored wheels against wheels/lock.json.
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+import urllib.request
+from pathlib import Path
+from urllib.parse import urljoin, urlparse
+
+WHEELHOUSE = Path(__file__).resolve().parent / 'wheels'
+LOCK_NAME = 'lock.json'
+
+# Packages frozen from the Pyodide distribution only have a file name, relative to this
+PYODIDE_INDEX = 'https://cdn.jsdelivr.net/pyodide/v0.28.0a3/full/'
+
+
+def sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download(url, target):
+    partial = target.with_name(target.name + '.part')
+    with urllib.request.urlopen(url) as response, open(partial, 'wb') as f:
+        while chunk := response.read(1024 * 1024):
+            f.write(chunk)
+    partial.replace(target)
+
+
+def vendor(freeze_path, index_url, wheelhouse):
+    with open(freeze_path, encoding='utf-8') as f:
+        lock = json.load(f)
+
+    wheelhouse.mkdir(parents=True, exist_ok=True)
+    packages = {}
+    for name, package in lock['packages'].items():
+        if not package.get('file_name'):
+            # mock packages (micropip.add_mock_package) have no wheel; setup.py adds them again
+            continue
+        url = urljoin(index_url, package['file_name'])
+        file_name = Path(urlparse(url).path).name
+        target = wheelhouse / file_name
+        expected = package.get('sha256')
+
+        if target.exists() and (not expected or sha256(target) == expected):
+            print(f"✅ {file_name} (already vendored)")
+        else:
+            print(f"⬇️  {file_name}")
+            download(url, target)
+            if expected and sha256(target) != expected:
+                target.unlink()
+                raise SystemExit(f"❌ sha256 mismatch for {file_name} from {url}")
+
+        packages[name] = {**package, 'file_name': file_name, 'sha256': sha256(target)}
+
+    with open(wheelhouse / LOCK_NAME, 'w', encoding='utf-8') as f:
+        json.dump({**lock, 'packages': packages}, f, indent=2)
+    print(f"📦 Vendored {len(packages)} package(s) into {wheelhouse}")
+
+
+def check(wheelhouse):
+    with open(wheelhouse / LOCK_NAME, encoding='utf-8') as f:
+        lock = json.load(f)
+
+    failures = 0
+    for name, package in lock['packages'].items():
+        target = wheelhouse / package['file_name']
+        if not target.exists():
+            print(f"❌ {name}: {package['file_name']} is missing")
+            failures += 1
+        elif sha256(target) != package['sha256']:
+            print(f"❌ {name}: {package['file_name']} does not match its sha256")
+            failures += 1
+
+    print(f"{'✅' if not failures else '❌'} {len(lock['packages']) - failures}/{len(lock['packages'])} wheel(s) ok")
+    return failures == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--wheelhouse', type=Path, default=WHEELHOUSE, help='wheel directory (default: wheels/)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    vendor_parser = commands.add_parser('vendor', help='download the wheels of a micropip.freeze() lock')
+    vendor_parser.add_argument('lock', help='pyodide-lock.json written by the page with ?freeze')
+    vendor_parser.add_argument('--index-url', default=PYODIDE_INDEX,
+                               help=f'base URL for wheels without a full URL (default: {PYODIDE_INDEX})')
+
+    commands.add_parser('check', help='verify the vendored wheels against wheels/lock.json')
+    args = parser.parse_args()
+
+    if args.command == 'vendor':
+        vendor(args.lock, args.index_url, args.wheelhouse)
+    elif not check(args.wheelhouse):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()